@@ -5,8 +5,26 @@ GitCleaner - Аналог BFG Repo-Cleaner на Python
 __version__ = "1.0.0"
 __author__ = "DMZAM"
 
-from .core import GitCleaner
-from .cleaner import Cleaner
-from .exceptions import GitCleanerError
+from importlib import import_module
 
-__all__ = ["GitCleaner", "Cleaner", "GitCleanerError"]
\ No newline at end of file
+# Классы загружаются при первом обращении: `import gitcleaner.cli` не тянет core и его зависимости
+_EXPORTS = {
+    "GitCleaner": ".core",
+    "Cleaner": ".cleaner",
+    "RuleSet": ".rules",
+    "FleetCleaner": ".fleet",
+    "GitCleanerError": ".exceptions",
+}
+
+__all__ = ["GitCleaner", "Cleaner", "RuleSet", "FleetCleaner", "GitCleanerError"]
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
\ No newline at end of file
@@ -0,0 +1,33 @@
+"""
+Сохранение результатов переписывания для последующей проверки
+"""
+
+import os
+from pathlib import Path
+from typing import Dict, Iterable, Union
+
+from .utils import BlobIdSet
+
+# Файлы с результатами последнего реального запуска (в .git/gitcleaner)
+COMMIT_MAP_FILE = 'commit-map'
+PURGED_BLOBS_FILE = 'purged-blobs'
+
+def _write_lines(path: Path, lines: Iterable[str]):
+    """Записывает строки атомарно, через временный файл"""
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as fh:
+        for line in lines:
+            fh.write(line + '\n')
+    os.replace(tmp_path, path)
+
+def save_run_mapping(run_dir: Union[str, Path], commit_map: Dict[str, str], purged_blobs: Iterable[str]):
+    """Сохраняет карту коммитов ("старый новый") и список удаленных из истории blob'ов
+
+    BlobIdSet уже отсортирован и пишется потоково; другие наборы сортируются.
+    """
+    run_dir = Path(run_dir)
+    run_dir.mkdir(parents=True, exist_ok=True)
+    _write_lines(run_dir / COMMIT_MAP_FILE, (f'{old} {new}' for old, new in sorted(commit_map.items())))
+    if not isinstance(purged_blobs, BlobIdSet):
+        purged_blobs = sorted(purged_blobs)
+    _write_lines(run_dir / PURGED_BLOBS_FILE, purged_blobs)
@@ -0,0 +1,190 @@
+"""
+Чтение объектов через долгоживущий процесс git cat-file --batch
+"""
+
+import subprocess
+import threading
+from pathlib import Path
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, Optional, Tuple, Union
+
+from .exceptions import GitCommandError
+
+class CatFileBatch:
+    """Читает объекты одним процессом git cat-file вместо процесса на объект"""
+
+    def __init__(self, repo_path: Union[str, Path], env: Optional[Dict[str, str]] = None):
+        self.repo_path = Path(repo_path)
+        self.env = env
+        self._proc: Optional[subprocess.Popen] = None
+        self._check_proc: Optional[subprocess.Popen] = None
+
+    def _spawn(self, mode: str = '--batch') -> subprocess.Popen:
+        try:
+            return subprocess.Popen(
+                ['git', 'cat-file', mode],
+                cwd=self.repo_path,
+                env=self.env,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL
+            )
+        except FileNotFoundError:
+            raise GitCommandError(['git', 'cat-file', mode], 1, "Git not found")
+
+    @staticmethod
+    def _read_object(stdout) -> Tuple[str, Optional[str], Optional[bytes]]:
+        """Читает один ответ cat-file: (sha, тип, данные) или (sha, None, None)"""
+        header = stdout.readline()
+        if not header:
+            raise GitCommandError(['git', 'cat-file', '--batch'], 1, "Unexpected end of output")
+        parts = header.decode().split()
+        if len(parts) != 3:
+            return parts[0], None, None
+        sha, type_, size = parts[0], parts[1], int(parts[2])
+        data = stdout.read(size)
+        stdout.read(1)
+        return sha, type_, data
+
+    def read(self, sha: str) -> Tuple[Optional[str], Optional[bytes]]:
+        """Читает объект; для отсутствующего объекта возвращает (None, None)"""
+        if self._proc is None or self._proc.poll() is not None:
+            self._proc = self._spawn()
+        self._proc.stdin.write(sha.encode() + b'\n')
+        self._proc.stdin.flush()
+        _, type_, data = self._read_object(self._proc.stdout)
+        return type_, data
+
+    def copy(self, sha: str, write: Callable[[bytes], Any],
+             chunk_size: int = 1 << 20) -> Tuple[Optional[str], int]:
+        """Передает содержимое объекта частями в write, не держа его целиком в памяти
+
+        Возвращает (тип, размер); для отсутствующего объекта - (None, 0).
+        """
+        if self._proc is None or self._proc.poll() is not None:
+            self._proc = self._spawn()
+        self._proc.stdin.write(sha.encode() + b'\n')
+        self._proc.stdin.flush()
+        stdout = self._proc.stdout
+        _, type_, size = self._read_info(stdout)
+        if type_ is None:
+            return None, 0
+        remaining = size
+        while remaining:
+            chunk = stdout.read(min(chunk_size, remaining))
+            if not chunk:
+                raise GitCommandError(['git', 'cat-file', '--batch'], 1, "Unexpected end of output")
+            write(chunk)
+            remaining -= len(chunk)
+        stdout.read(1)
+        return type_, size
+
+    def info(self, sha: str) -> Tuple[Optional[str], int]:
+        """Возвращает тип и размер объекта без чтения содержимого; (None, 0) для отсутствующего"""
+        if self._check_proc is None or self._check_proc.poll() is not None:
+            self._check_proc = self._spawn('--batch-check')
+        self._check_proc.stdin.write(sha.encode() + b'\n')
+        self._check_proc.stdin.flush()
+        _, type_, size = self._read_info(self._check_proc.stdout)
+        return type_, size
+
+    def iter_objects(self, shas: Iterable[str]) -> Iterator[Tuple[str, Optional[str], Optional[bytes]]]:
+        """Потоково читает много объектов: (sha, тип, данные), для отсутствующих - (sha, None, None)"""
+        for _, result in self._stream('--batch', ((sha, None) for sha in shas), self._read_object):
+            yield result
+
+    def iter_tagged_objects(self, items: Iterable[Tuple[str, Any]]) -> Iterator[Tuple[Any, str, Optional[str], Optional[bytes]]]:
+        """Потоково читает объекты с метками: (метка, sha, тип, данные), как iter_info"""
+        for tag, (sha, type_, data) in self._stream('--batch', items, self._read_object):
+            yield tag, sha, type_, data
+
+    def iter_info(self, items: Iterable[Tuple[str, Any]]) -> Iterator[Tuple[Any, str, Optional[str], int]]:
+        """Потоково получает тип и размер объектов: (метка, sha, тип, размер)
+
+        items - пары (sha, метка); метка возвращается вместе с ответом, что
+        позволяет не держать в памяти словарь всех запрошенных объектов.
+        """
+        for tag, (sha, type_, size) in self._stream('--batch-check', items, self._read_info):
+            yield tag, sha, type_, size
+
+    @staticmethod
+    def _read_info(stdout) -> Tuple[str, Optional[str], int]:
+        header = stdout.readline()
+        if not header:
+            raise GitCommandError(['git', 'cat-file', '--batch-check'], 1, "Unexpected end of output")
+        parts = header.decode().split()
+        if len(parts) != 3:
+            return parts[0], None, 0
+        return parts[0], parts[1], int(parts[2])
+
+    def _stream(self, mode: str, items: Iterable[Tuple[str, Any]],
+                read_one: Callable) -> Iterator[Tuple[Any, Any]]:
+        """Пишет запросы в отдельном потоке и по мере готовности читает ответы"""
+        try:
+            proc = subprocess.Popen(
+                ['git', 'cat-file', mode],
+                cwd=self.repo_path,
+                env=self.env,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL
+            )
+        except FileNotFoundError:
+            raise GitCommandError(['git', 'cat-file', mode], 1, "Git not found")
+        pending: Deque[Any] = deque()
+        state: Dict[str, Any] = {'finished': False, 'error': None}
+        ready = threading.Condition()
+
+        def writer():
+            try:
+                for sha, tag in items:
+                    try:
+                        proc.stdin.write(sha.encode() + b'\n')
+                    except (BrokenPipeError, ValueError):
+                        break  # cat-file завершился или чтение прекращено: ответ уже не нужен
+                    with ready:
+                        pending.append(tag)
+                        ready.notify()
+            except BaseException as e:
+                # Ошибка источника запросов передается читателю, а не обрывает поток молча
+                state['error'] = e
+            finally:
+                try:
+                    proc.stdin.close()
+                except (BrokenPipeError, ValueError):
+                    pass
+                with ready:
+                    state['finished'] = True
+                    ready.notify()
+
+        thread = threading.Thread(target=writer, name="gitcleaner-cat-file", daemon=True)
+        thread.start()
+        try:
+            while True:
+                with ready:
+                    while not pending and not state['finished']:
+                        ready.wait()
+                    if not pending:
+                        break
+                    tag = pending.popleft()
+                yield tag, read_one(proc.stdout)
+            if state['error'] is not None:
+                raise state['error']
+        finally:
+            proc.stdout.close()
+            proc.kill()
+            proc.wait()
+            thread.join()
+
+    def close(self):
+        """Завершает процессы cat-file"""
+        for proc in (self._proc, self._check_proc):
+            if proc is not None:
+                try:
+                    proc.stdin.close()
+                except (BrokenPipeError, ValueError):
+                    pass
+                proc.wait()
+                proc.stdout.close()
+        self._proc = None
+        self._check_proc = None
@@ -0,0 +1,90 @@
+"""
+Кэши с ограничением по памяти
+"""
+
+import sys
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+_MISSING = object()
+
+def str_entry_size(key: Any, value: Any) -> int:
+    """Приблизительный размер записи с ключом-строкой и небольшим значением"""
+    return sys.getsizeof(key) + 100
+
+class LRUCache:
+    """LRU-кэш с учетом приблизительного размера записей
+
+    Без лимита (max_bytes=None) ведет себя как обычный словарь и не тратит
+    время на поддержание порядка. С лимитом вытесняет давно не использованные
+    записи и считает вытеснения.
+    """
+
+    def __init__(self, name: str, max_bytes: Optional[int] = None,
+                 entry_size: Callable[[Any, Any], int] = str_entry_size):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.entry_size = entry_size
+        self._data: 'OrderedDict[Hashable, Any]' = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        value = self._data.get(key, _MISSING)
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        self.hits += 1
+        if self.max_bytes is not None:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                pass  # Запись вытеснена другим потоком
+        return value
+
+    def __setitem__(self, key: Hashable, value: Any):
+        old = self._data.pop(key, _MISSING)
+        if old is not _MISSING:
+            self.bytes -= self.entry_size(key, old)
+        self._data[key] = value
+        self.bytes += self.entry_size(key, value)
+        if self.max_bytes is not None:
+            while self.bytes > self.max_bytes and self._data:
+                try:
+                    evicted_key, evicted = self._data.popitem(last=False)
+                except KeyError:
+                    break
+                self.bytes -= self.entry_size(evicted_key, evicted)
+                self.evictions += 1
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def clear(self):
+        self._data.clear()
+        self.bytes = 0
+
+    def resize(self, max_bytes: Optional[int]):
+        """Меняет лимит и сразу вытесняет лишнее"""
+        self.max_bytes = max_bytes
+        if max_bytes is not None:
+            while self.bytes > max_bytes and self._data:
+                evicted_key, evicted = self._data.popitem(last=False)
+                self.bytes -= self.entry_size(evicted_key, evicted)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика кэша"""
+        return {
+            'entries': len(self._data),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
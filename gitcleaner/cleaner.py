@@ -3,206 +3,875 @@
 """
 
 import os
+import hashlib
+import sys
 import subprocess
+import sqlite3
+import tempfile
 import logging
-from typing import List, Dict, Set, Optional, Callable, Tuple
+from typing import List, Dict, Set, Optional, Callable, Tuple, Iterable, Iterator, Union
 from pathlib import Path
-from tqdm import tqdm
 
 from .exceptions import GitCommandError
-from .utils import match_patterns, is_binary_file, human_readable_size
+from .utils import is_binary_file, human_readable_size, load_blob_ids, BlobIdSet
+from .planner import ReadPlan
+from .rules import RuleSet
+from .batch import CatFileBatch
+from .cache import LRUCache
+from .inventory import ObjectInventory, parse_tree
+from .prefilter import NeedleIndex
+from .audit import PURGED_BLOBS_FILE, save_run_mapping
+from .objects import split_object, scrub_message, build_commit, build_tag
+from .lfs import LFSStore, POINTER_MAX_SIZE, attributes_line, is_pointer, make_pointer, merge_attributes
+from .events import EventSink, TqdmSink, PhaseChanged, CommitRewritten, BlobDeleted, RefUpdated
+
+def _tree_entry_size(key: Tuple[str, str], value: Tuple) -> int:
+    """Приблизительный размер записи кэша деревьев: две строки SHA, путь и кортеж"""
+    tree, prefix = key
+    return 2 * sys.getsizeof(tree) + sys.getsizeof(prefix) + 200 + sum(sys.getsizeof(path) for path in value[-1])
+
+def _tree_entries_size(key: str, value: List[Tuple[str, str, str]]) -> int:
+    """Приблизительный размер разобранного дерева"""
+    return sys.getsizeof(key) + sum(200 + len(name) for _, name, _ in value)
+
+def _replaced_entry_size(key: Tuple[str, Tuple[int, ...]], value: Tuple[str, str, int]) -> int:
+    """Приблизительный размер записи кэша замен: два SHA, номера групп и кортеж"""
+    blob_sha, groups = key
+    return 2 * sys.getsizeof(blob_sha) + sys.getsizeof(groups) + 200
 
 class Cleaner:
     """Класс для выполнения операций очистки"""
     
-    def __init__(self, repo_path: str, dry_run: bool = False):
+    def __init__(self, repo_path: str, dry_run: bool = False, rules: Optional[RuleSet] = None,
+                 sink: Optional[EventSink] = None):
         self.repo_path = Path(repo_path)
         self.dry_run = dry_run
         self.logger = logging.getLogger(__name__)
         
-        # Настройки очистки
-        self.files_to_delete: Set[str] = set()
-        self.patterns_to_delete: List[str] = []
-        self.size_threshold: Optional[int] = None
-        self.text_replacements: List[Tuple[str, str, Optional[List[str]]]] = []
-        self.folders_to_delete: Set[str] = set()
+        # Окружение дочерних процессов git (в частичном клоне запрещает ленивую докачку)
+        self._env: Optional[Dict[str, str]] = None
+        
+        # Настройки очистки (могут разделяться между несколькими репозиториями)
+        self.rules = rules if rules is not None else RuleSet()
+        
+        # Чтение объектов одним процессом cat-file
+        self._reader = CatFileBatch(self.repo_path)
+        
+        # Индекс blob'ов со строками для замены (строится перед переписыванием)
+        self._needle_index: Optional[NeedleIndex] = None
+        
+        # Ревизии для переписывания (None = вся история, как rev-list --all)
+        self.revisions: Optional[List[str]] = None
+        
+        # Приемник событий прогресса (по умолчанию - прогресс-бар tqdm)
+        self.sink = sink if sink is not None else TqdmSink()
+        
+        # Кэш переписанных деревьев: исходное дерево -> (новое дерево, удалено, заменено, байт)
+        self._tree_cache = LRUCache('trees', entry_size=_tree_entry_size)
+        
+        # Размеры blob'ов и разобранные деревья
+        self._blob_sizes = LRUCache('blob_sizes')
+        self._tree_entries = LRUCache('tree_entries', entry_size=_tree_entries_size)
+        
+        # Постоянный инвентарь объектов в .git/gitcleaner (граф коммитов, деревья, размеры)
+        self.use_inventory = True
+        self._inventory: Optional[ObjectInventory] = None
+        self._inventory_graph_synced = False
+        
+        # Перенос в LFS: исходный blob -> (blob pointer-файла, сэкономлено байт)
+        self._lfs_store: Optional[LFSStore] = None
+        self._lfs_pointers: Dict[str, Tuple[str, Optional[int]]] = {}
+        
+        # Замены текста: (исходный blob, применимые группы замен) -> (новый SHA, итог, удалено байт)
+        self._replaced_blobs = LRUCache('replaced_blobs', entry_size=_replaced_entry_size)
+        
+        # Частичный клон: отсутствующие объекты не запрашиваются у promisor remote по одному.
+        # Нужное правилам содержимое докачивается одним запросом ('prefetch') или пропускается ('skip')
+        self.missing_blobs = 'prefetch'
+        self.partial_clone: Optional[bool] = None
+        self._promisor_remote: Optional[str] = None
+        self._missing: Optional[BlobIdSet] = None
+        self._skipped_missing: Set[str] = set()
+        
+        # Blob'ы, убранные из переписанных деревьев и оставшиеся в них (для verify --purged)
+        self._removed_blobs = BlobIdSet()
+        self._retained_blobs = BlobIdSet()
+        
+        # Замены без паттернов файлов применяются и к сообщениям коммитов и аннотированных тегов
+        self.scrub_messages = True
         
         # Статистика
         self.stats = {
             'commits_processed': 0,
             'files_deleted': 0,
             'files_replaced': 0,
+            'files_converted': 0,
             'bytes_removed': 0,
-            'commits_rewritten': 0
+            'commits_rewritten': 0,
+            'messages_replaced': 0,
+            'tags_rewritten': 0,
+            'blobs_missing': 0
         }
     
     def delete_files_by_name(self, filenames: List[str]) -> Dict[str, int]:
         """Добавляет файлы для удаления по именам"""
-        for filename in filenames:
-            self.files_to_delete.add(filename)
-        return {'files_added': len(filenames)}
+        return self.rules.delete_files_by_name(filenames)
     
     def delete_files_by_pattern(self, patterns: List[str]) -> Dict[str, int]:
         """Добавляет паттерны для удаления файлов"""
-        self.patterns_to_delete.extend(patterns)
-        return {'patterns_added': len(patterns)}
+        return self.rules.delete_files_by_pattern(patterns)
     
     def delete_files_larger_than(self, size_bytes: int) -> Dict[str, int]:
         """Устанавливает порог размера для удаления файлов"""
-        self.size_threshold = size_bytes
-        return {'size_threshold': size_bytes}
+        return self.rules.delete_files_larger_than(size_bytes)
     
     def replace_text_in_files(self, old_text: str, new_text: str, 
                             file_patterns: Optional[List[str]] = None) -> Dict[str, int]:
         """Добавляет правило замены текста"""
-        self.text_replacements.append((old_text, new_text, file_patterns))
-        return {'replacements_added': 1}
+        return self.rules.replace_text_in_files(old_text, new_text, file_patterns)
     
     def delete_folders(self, folder_names: List[str]) -> Dict[str, int]:
         """Добавляет папки для удаления"""
-        for folder in folder_names:
-            self.folders_to_delete.add(folder)
-        return {'folders_added': len(folder_names)}
+        return self.rules.delete_folders(folder_names)
+    
+    def convert_to_lfs(self, patterns: Optional[List[str]] = None,
+                       size_bytes: Optional[int] = None) -> Dict[str, int]:
+        """Добавляет правило переноса blob'ов в LFS"""
+        return self.rules.convert_to_lfs(patterns, size_bytes)
+    
+    def delete_blobs_by_id(self, blob_ids: Iterable[Union[str, bytes]]) -> Dict[str, int]:
+        """Добавляет blob'ы для удаления по их SHA (независимо от пути)"""
+        return self.rules.delete_blobs_by_id(blob_ids)
+    
+    def limit_to_revisions(self, revisions: List[str]) -> Dict[str, int]:
+        """Ограничивает переписывание диапазонами и выборками ревизий (v3.0..main, --branches=release/*)"""
+        if self.revisions is None:
+            self.revisions = []
+        self.revisions.extend(revisions)
+        return {'revisions_added': len(revisions)}
+    
+    def set_memory_limit(self, max_bytes: Optional[int]) -> Dict[str, int]:
+        """Ограничивает память кэшей (деревья, размеры blob'ов, замены, решения по путям)
+        
+        Около 20% бюджета остается на рабочие данные текущего коммита.
+        """
+        if max_bytes is None:
+            limits = {'trees': None, 'tree_entries': None, 'blob_sizes': None,
+                      'replaced_blobs': None, 'rules': None}
+        else:
+            limits = {'trees': max_bytes // 5, 'tree_entries': max_bytes // 5,
+                      'blob_sizes': max_bytes // 10, 'replaced_blobs': max_bytes // 10,
+                      'rules': max_bytes // 5}
+        self._tree_cache.resize(limits['trees'])
+        self._tree_entries.resize(limits['tree_entries'])
+        self._blob_sizes.resize(limits['blob_sizes'])
+        self._replaced_blobs.resize(limits['replaced_blobs'])
+        self.rules.set_cache_limit(limits['rules'])
+        return {'memory_limit': max_bytes}
+    
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        """Статистика кэшей: записи, занятая память, попадания и вытеснения"""
+        stats = {
+            'trees': self._tree_cache.stats(),
+            'tree_entries': self._tree_entries.stats(),
+            'blob_sizes': self._blob_sizes.stats(),
+            'replaced_blobs': self._replaced_blobs.stats(),
+        }
+        stats.update(self.rules.cache_stats())
+        return stats
     
     def run_cleanup(self) -> Dict[str, any]:
         """Выполняет полную очистку"""
         self.logger.info("Starting repository cleanup...")
+        sink = self.sink
+        emit_events = sink.wants_events
         
-        # Получаем все коммиты
-        commits = self._get_all_commits()
-        self.logger.info(f"Found {len(commits)} commits to process")
-        
-        # Карта переписанных коммитов
-        commit_map = {}
-        
-        # Обрабатываем коммиты в обратном порядке (от старых к новым)
-        for commit in tqdm(commits, desc="Processing commits", unit="commit"):
-            new_commit = self._rewrite_commit(commit)
-            commit_map[commit] = new_commit
-            self.stats['commits_processed'] += 1
+        try:
+            # Определяем, какие blob'ы действительно нужно читать
+            if emit_events:
+                sink.emit(PhaseChanged('plan'))
+            for line in self.rules.plan.describe():
+                self.logger.debug(f"Read plan: {line}")
+            
+            # В частичном клоне нужные правилам blob'ы докачиваются заранее одним запросом
+            if self._check_partial_clone() and self.missing_blobs == 'prefetch':
+                if emit_events:
+                    sink.emit(PhaseChanged('prefetch'))
+                self._prefetch_missing()
+            
+            # Находим blob'ы, в которых вообще есть строки для замены
+            if self.rules.plan.needs_any_content:
+                if emit_events:
+                    sink.emit(PhaseChanged('prefilter'))
+                self._needle_index = self._build_needle_index()
+            
+            # Получаем все коммиты
+            if emit_events:
+                sink.emit(PhaseChanged('enumerate'))
+            total = self._count_commits(self.revisions)
+            commits = self._iter_commit_graph(self.revisions)
+            if self._scrubs_messages():
+                # Сырые коммиты читаются тем же потоком, что и граф: сообщение нужно каждому коммиту
+                commits = self._iter_commit_objects(commits)
+            else:
+                commits = ((commit, tree, parents, None) for commit, tree, parents in commits)
+            self.logger.info(f"Found {total} commits to process")
+            
+            # Карта переписанных коммитов (только изменившиеся)
+            commit_map = {}
+            
+            # Обрабатываем коммиты в обратном порядке (от старых к новым)
+            if emit_events:
+                sink.emit(PhaseChanged('rewrite', total))
+            for index, (commit, tree, parents, raw) in enumerate(commits, 1):
+                new_commit = self._rewrite_commit(commit, tree, parents, commit_map, raw)
+                if new_commit != commit:
+                    commit_map[commit] = new_commit
+                self.stats['commits_processed'] += 1
+                if emit_events:
+                    sink.emit(CommitRewritten(commit, new_commit, index, total))
+            
+            # Обновляем ссылки
+            if not self.dry_run:
+                if emit_events:
+                    sink.emit(PhaseChanged('update_refs'))
+                self._update_refs(commit_map)
+            
+            # Теги переносятся на переписанные коммиты, сообщения аннотированных тегов очищаются
+            self._rewrite_tags(commit_map)
+            if not self.dry_run:
+                purged = self._save_run_mapping(commit_map)
+                if commit_map:
+                    self._prune_inventory(purged)
+            
+            self.stats['blobs_missing'] = len(self._skipped_missing)
+            if self._skipped_missing:
+                self.logger.warning(f"Skipped {len(self._skipped_missing)} blobs missing from the partial clone")
+            
+            if emit_events:
+                sink.emit(PhaseChanged('done'))
+        finally:
+            self._reader.close()
+            self._close_inventory()
+            sink.close()
         
-        # Обновляем ссылки
-        if not self.dry_run:
-            self._update_refs(commit_map)
+        cache_stats = self.cache_stats()
+        evictions = sum(cache['evictions'] for cache in cache_stats.values())
+        if evictions:
+            self.logger.info(f"Cache evictions under memory limit: {evictions}")
         
         return {
             'stats': self.stats.copy(),
-            'commit_map': commit_map if self.dry_run else None
+            'commit_map': commit_map if self.dry_run else None,
+            'cache_stats': cache_stats
         }
     
-    def _get_all_commits(self) -> List[str]:
-        """Получает все коммиты в репозитории"""
+    def build_read_plan(self) -> ReadPlan:
+        """Строит план чтения содержимого по настроенным правилам"""
+        return self.rules.build_read_plan()
+    
+    def estimate_reads(self, plan: ReadPlan) -> ReadPlan:
+        """Оценивает объем чтения по уникальным blob'ам репозитория"""
+        self._check_partial_clone()
+        blobs_total = bytes_total = blobs_to_read = bytes_to_read = blobs_deleted = 0
         try:
-            output = self._run_git(['log', '--all', '--pretty=format:%H', '--reverse'])
-            return output.splitlines() if output else []
+            for sha, path, size in self._iter_reachable_blobs(self.revisions):
+                blobs_total += 1
+                bytes_total += size
+                if self._should_delete_file(path, sha, size):
+                    blobs_deleted += 1
+                elif plan.needs_content(path):
+                    blobs_to_read += 1
+                    bytes_to_read += size
+        except GitCommandError as e:
+            self.logger.warning(f"Failed to estimate reads: {e}")
+            return plan
+        
+        plan.set_estimate(blobs_total, bytes_total, blobs_to_read, bytes_to_read, blobs_deleted)
+        return plan
+    
+    def _iter_reachable_blobs(self, revisions: Optional[List[str]] = None) -> Iterator[Tuple[str, str, int]]:
+        """Потоково перечисляет уникальные достижимые blob'ы: (SHA, путь первого вхождения, размер)"""
+        # Отсутствующие в частичном клоне объекты печатаются как "?SHA" без пути и пропускаются
+        missing = ['--missing=print'] if self.partial_clone else []
+        
+        def objects():
+            for line in self._stream_git(['rev-list', '--objects'] + missing + (revisions if revisions else ['--all']) + ['--']):
+                parts = line.split(' ', 1)
+                if len(parts) == 2 and parts[1]:
+                    yield parts[0], parts[1]
+        
+        for path, sha, type_, size in self._reader.iter_info(objects()):
+            if type_ == 'blob':
+                self._remember_blob_size(sha, size)
+                yield sha, path, size
+    
+    def _build_needle_index(self) -> Optional[NeedleIndex]:
+        """Находит blob'ы, содержащие строки для замены (с сохранением индекса в .git)"""
+        index = self.rules.needle_index()
+        if not index:
+            return None
+        index_path = self._git_dir() / 'gitcleaner' / f'needles-{index.key}.idx'
+        cached = index.load(index_path)
+        
+        try:
+            plan = self.rules.plan
+            candidates = (sha for sha, path, size in self._iter_reachable_blobs(self.revisions)
+                          if plan.needs_content(path) and not self._should_delete_file(path, sha, size))
+            result = index.scan(self._reader, candidates)
+        except GitCommandError as e:
+            self.logger.warning(f"Prefilter failed, every candidate blob will be read: {e}")
+            return None
+        
+        self.logger.info(f"Prefilter: scanned {result['blobs_scanned']} blobs "
+                         f"({human_readable_size(result['bytes_scanned'])}), "
+                         f"{len(index.hits)} contain replacement strings"
+                         f"{' (index reused)' if cached else ''}")
+        if result['blobs_scanned']:
+            try:
+                index.save(index_path)
+            except OSError as e:
+                self.logger.warning(f"Failed to save prefilter index: {e}")
+        return index
+    
+    def _promisor_remotes(self) -> List[str]:
+        """Promisor remote'ы частичного клона (пустой список для полного клона)"""
+        remotes = []
+        try:
+            output = self._run_git(['config', '--get-regexp', r'^remote\..*\.promisor$'])
         except GitCommandError:
-            return []
+            output = ''  # Ни одного такого ключа
+        for line in output.splitlines():
+            key, _, value = line.partition(' ')
+            if value.strip().lower() in ('true', 'yes', 'on', '1'):
+                remotes.append(key[len('remote.'):-len('.promisor')])
+        try:
+            name = self._run_git(['config', '--get', 'extensions.partialclone'])
+            if name and name not in remotes:
+                remotes.append(name)
+        except GitCommandError:
+            pass
+        return remotes
+    
+    def _check_partial_clone(self) -> bool:
+        """Определяет частичный клон и находит отсутствующие объекты, ничего не докачивая
+        
+        Все дочерние процессы git получают GIT_NO_LAZY_FETCH=1, поэтому случайное
+        обращение к отсутствующему объекту завершается ошибкой, а не сетевым запросом.
+        """
+        if self.partial_clone is not None:
+            return self.partial_clone
+        remotes = self._promisor_remotes()
+        self.partial_clone = bool(remotes)
+        if self.partial_clone:
+            self._promisor_remote = remotes[0]
+            self._env = dict(os.environ, GIT_NO_LAZY_FETCH='1')
+            self._reader.close()
+            self._reader.env = self._env
+            self._missing = self._find_missing_objects()
+            self.logger.info(f"Partial clone (promisor remote {self._promisor_remote}): "
+                             f"{len(self._missing)} objects are missing locally")
+        return self.partial_clone
+    
+    def _find_missing_objects(self) -> BlobIdSet:
+        """Перечисляет отсутствующие объекты (rev-list --missing=print не докачивает их)
+        
+        Переписываются полные деревья коммитов, поэтому для диапазона "A..B"
+        обход начинается с деревьев самих коммитов: объекты, достижимые и из A,
+        тоже проверяются.
+        """
+        args = ['rev-list', '--objects', '--missing=print']
+        if not self.revisions:
+            lines = self._stream_git(args + ['--all', '--'])
+        else:
+            trees = ''.join(f'{tree}\n' for _, tree, _ in self._iter_commit_graph(self.revisions))
+            if not trees:
+                return BlobIdSet()
+            lines = self._stream_git(args + ['--stdin', '--'], trees)
+        return BlobIdSet(line[1:] for line in lines if line.startswith('?'))
+    
+    def _needs_missing_content(self, path: str, blob_sha: str) -> bool:
+        """Нужно ли правилам содержимое отсутствующего blob'а (удаляемые по пути не нужны)"""
+        rules = self.rules
+        if blob_sha in rules.blob_ids_to_delete or rules.path_deleted(path):
+            return False
+        if rules.lfs_matches(path):
+            return True
+        return rules.plan.needs_content(path)
     
-    def _rewrite_commit(self, commit: str) -> str:
-        """Переписывает коммит с учетом правил очистки"""
+    def _prefetch_missing(self) -> int:
+        """Докачивает одним запросом только отсутствующие blob'ы, содержимое которых нужно правилам
+        
+        Деревья частичного клона есть локально, поэтому пути находятся без сети.
+        Если докачать не удалось, такие blob'ы при переписывании пропускаются.
+        """
+        if not self._missing:
+            return 0
+        wanted = BlobIdSet()
+        # Пройденные пары (дерево, путь) хранятся 20-байтными хэшами
+        seen = BlobIdSet()
         try:
-            # Получаем дерево коммита
-            tree = self._run_git(['rev-parse', f'{commit}^{{tree}}'])
-            
-            # Получаем все blob'ы в дереве
-            blobs = self._get_tree_blobs(tree)
-            
-            # Формируем новые записи для дерева
-            new_entries = []
-            files_deleted = 0
-            files_replaced = 0
-            bytes_removed = 0
-            
-            for path, blob_info in blobs.items():
-                blob_sha, mode = blob_info
-                
-                # Проверяем, нужно ли удалять файл
-                if self._should_delete_file(path, blob_sha):
-                    files_deleted += 1
-                    self.stats['files_deleted'] += 1
-                    continue
-                
-                # Читаем содержимое файла
-                data = self._read_blob(blob_sha)
-                original_size = len(data)
-                
-                # Применяем замены текста
-                new_data = self._apply_text_replacements(data, path)
-                if new_data != 
-                    files_replaced += 1
-                    self.stats['files_replaced'] += 1
-                
-                # Записываем новый blob (если данные изменились)
-                if new_data != 
-                    if not self.dry_run:
-                        new_blob_sha = self._write_blob(new_data)
-                    else:
-                        new_blob_sha = blob_sha  # В режиме dry-run используем оригинальный SHA
-                    bytes_removed += original_size - len(new_data)
-                else:
-                    new_blob_sha = blob_sha
-                
-                new_entries.append((mode, 'blob', new_blob_sha, path))
+            for _, tree, _ in self._iter_commit_graph(self.revisions):
+                stack = [(tree, '')]
+                while stack:
+                    current, prefix = stack.pop()
+                    key = hashlib.sha1(f'{current}\0{prefix}'.encode('utf-8', 'surrogateescape')).digest()
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    for mode, name, sha in self._read_tree_entries(current):
+                        path = prefix + name
+                        if mode == '040000':
+                            stack.append((sha, path + '/'))
+                        elif mode != '160000' and sha in self._missing and self._needs_missing_content(path, sha):
+                            wanted.add(sha)
+        except GitCommandError as e:
+            self.logger.warning(f"Failed to find blobs to prefetch: {e}")
+            return 0
+        if not wanted:
+            return 0
+        
+        # Так же git сам докачивает объекты promisor remote, но здесь - все сразу
+        cmd = ['git', '-c', 'fetch.negotiationAlgorithm=noop', 'fetch', self._promisor_remote,
+               '--no-tags', '--no-write-fetch-head', '--recurse-submodules=no', '--filter=blob:none', '--stdin']
+        result = subprocess.run(cmd, cwd=self.repo_path, input=''.join(f'{sha}\n' for sha in wanted),
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            self.logger.warning(f"Failed to prefetch {len(wanted)} blobs: {result.stderr.strip()}")
+            return 0
+        self._missing = self._missing - wanted
+        self.logger.info(f"Prefetched {len(wanted)} blobs from {self._promisor_remote}")
+        return len(wanted)
+    
+    def _git_dir(self) -> Path:
+        """Возвращает путь к каталогу .git"""
+        git_dir = Path(self._run_git(['rev-parse', '--git-dir']))
+        return git_dir if git_dir.is_absolute() else self.repo_path / git_dir
+    
+    def _get_all_commits(self, revisions: Optional[List[str]] = None) -> List[str]:
+        """Получает все коммиты в репозитории (или в указанных ревизиях)"""
+        return [commit for commit, _, _ in self._iter_commit_graph(revisions)]
+    
+    def _count_commits(self, revisions: Optional[List[str]] = None) -> int:
+        """Считает коммиты без их перечисления (заодно проверяет ревизии)"""
+        inventory = None if revisions else self._inventory_graph()
+        if inventory is not None:
+            return inventory.count_graph()
+        try:
+            return int(self._run_git(['rev-list', '--count'] + (revisions if revisions else ['--all']) + ['--']))
+        except (GitCommandError, ValueError):
+            if revisions:
+                raise
+            return 0
+    
+    def _iter_commit_graph(self, revisions: Optional[List[str]] = None) -> Iterator[Tuple[str, str, List[str]]]:
+        """Потоково перечисляет коммиты (SHA, дерево, родители): родители идут раньше потомков
+        
+        Коммиты вне указанных ревизий не попадают в поток и остаются как есть.
+        """
+        inventory = None if revisions else self._inventory_graph()
+        if inventory is not None:
+            yield from inventory.iter_graph()
+            return
+        try:
+            yield from self._parse_commit_log(revisions if revisions else ['--all'])
+        except GitCommandError:
+            if revisions:
+                raise
+    
+    def _parse_commit_log(self, revisions: List[str], input_text: Optional[str] = None) -> Iterator[Tuple[str, str, List[str]]]:
+        """Разбирает git log в (SHA, дерево, родители) в топологическом порядке"""
+        args = ['log', '--format=%H %T %P', '--topo-order', '--reverse']
+        for line in self._stream_git(args + revisions + ['--'], input_text):
+            parts = line.split()
+            if len(parts) >= 2:
+                yield parts[0], parts[1], parts[2:]
+    
+    def _get_inventory(self) -> Optional[ObjectInventory]:
+        """Открывает постоянный инвентарь объектов (None, если он выключен или недоступен)"""
+        if self._inventory is None and self.use_inventory:
+            try:
+                self._inventory = ObjectInventory(self._git_dir())
+            except (sqlite3.Error, OSError, GitCommandError) as e:
+                self.logger.warning(f"Object inventory cache disabled: {e}")
+                self.use_inventory = False
+        return self._inventory
+    
+    def _close_inventory(self):
+        """Сохраняет и закрывает инвентарь"""
+        if self._inventory is not None:
+            try:
+                self._inventory.close()
+            except sqlite3.Error as e:
+                self.logger.warning(f"Failed to save object inventory: {e}")
+            self._inventory = None
+            self._inventory_graph_synced = False
+    
+    def _list_tips(self) -> List[str]:
+        """Коммиты, на которые указывают ссылки и HEAD (как rev-list --all)"""
+        tips = []
+        fmt = '%(objecttype) %(objectname) %(*objecttype) %(*objectname)'
+        for line in self._stream_git(['for-each-ref', f'--format={fmt}']):
+            parts = line.split()
+            if parts[0] == 'commit':
+                tips.append(parts[1])
+            elif len(parts) == 4 and parts[2] == 'commit':
+                tips.append(parts[3])
+        try:
+            tips.append(self._run_git(['rev-parse', '--verify', '-q', 'HEAD^{commit}']))
+        except GitCommandError:
+            pass  # Пустой репозиторий или HEAD без коммитов
+        return sorted(set(tips))
+    
+    def _inventory_graph(self) -> Optional[ObjectInventory]:
+        """Возвращает инвентарь с актуальным графом коммитов для --all"""
+        inventory = self._get_inventory()
+        if inventory is None or self._inventory_graph_synced:
+            return inventory
+        try:
+            tips = self._list_tips()
+            if not inventory.graph_is_current(tips):
+                known = inventory.known_tips()
+                # Дочитываем только коммиты, которых не было при прошлом запуске
+                revs = ''.join(f'{tip}\n' for tip in tips) + ''.join(f'^{tip}\n' for tip in known)
+                try:
+                    inventory.update_graph(tips, self._parse_commit_log(['--stdin'], revs))
+                except GitCommandError:
+                    # Прежние вершины могли быть удалены gc - перестраиваем граф целиком
+                    revs = ''.join(f'{tip}\n' for tip in tips)
+                    inventory.update_graph(tips, self._parse_commit_log(['--stdin'], revs))
+        except (sqlite3.Error, GitCommandError) as e:
+            self.logger.warning(f"Object inventory cache disabled: {e}")
+            self._close_inventory()
+            self.use_inventory = False
+            return None
+        self._inventory_graph_synced = True
+        return inventory
+    
+    def _scrubs_messages(self) -> bool:
+        """Нужно ли применять замены к сообщениям коммитов и тегов"""
+        return self.scrub_messages and self.rules.has_replacements and self.rules.replacer.has_unscoped
+    
+    def _iter_commit_objects(self, commits: Iterator[Tuple[str, str, List[str]]]
+                             ) -> Iterator[Tuple[str, str, List[str], Optional[bytes]]]:
+        """Дополняет поток коммитов их сырыми объектами (один процесс cat-file на весь поток)"""
+        items = ((commit, (commit, tree, parents)) for commit, tree, parents in commits)
+        for (commit, tree, parents), _, type_, data in self._reader.iter_tagged_objects(items):
+            yield commit, tree, parents, data if type_ == 'commit' else None
+    
+    def _scrub_message(self, message: bytes, headers: List[bytes]) -> bytes:
+        """Применяет замены без паттернов файлов к сообщению коммита или тега"""
+        if not self._scrubs_messages():
+            return message
+        return scrub_message(message, headers, self.rules.replacer.apply_unscoped)
+    
+    def _rewrite_commit(self, commit: str, tree: str, parents: List[str],
+                        commit_map: Dict[str, str], raw: Optional[bytes] = None) -> str:
+        """Переписывает коммит с учетом правил очистки
+        
+        raw - сырой объект коммита, если он уже прочитан вместе с графом. Коммит,
+        у которого изменилось только сообщение, тоже получает новый SHA.
+        """
+        try:
+            # Одинаковые деревья переписываются один раз (кэш по дереву и пути)
+            new_tree, files_deleted, files_replaced, files_converted, bytes_removed = self._rewrite_tree(tree)
             
+            # Обновляем статистику
+            self.stats['files_deleted'] += files_deleted
+            self.stats['files_replaced'] += files_replaced
+            self.stats['files_converted'] += files_converted
             self.stats['bytes_removed'] += bytes_removed
             
-            # Обновляем статистику
-            if files_deleted > 0 or files_replaced > 0:
+            # Сообщение очищается теми же заменами, что и содержимое файлов
+            message_changed = False
+            if raw is not None:
+                headers, message = split_object(raw)
+                new_message = self._scrub_message(message, headers)
+                message_changed = new_message != message
+                if message_changed:
+                    self.stats['messages_replaced'] += 1
+            if files_deleted > 0 or files_replaced > 0 or files_converted > 0 or message_changed:
                 self.stats['commits_rewritten'] += 1
             
-            # Создаем новое дерево
-            if not self.dry_run:
-                new_tree = self._write_tree(new_entries)
-            else:
-                new_tree = tree  # В режиме dry-run используем оригинальное дерево
+            # Родители вне диапазона или без изменений остаются прежними
+            new_parents = [commit_map.get(parent, parent) for parent in parents]
+            if new_tree == tree and new_parents == parents and not message_changed:
+                return commit
             
-            # Создаем новый коммит
+            # Создаем новый коммит из исходного: автор, коммиттер и кодировка сохраняются
             if not self.dry_run:
-                parent = self._get_commit_parent(commit)
-                message = self._get_commit_message(commit)
-                new_commit = self._write_commit(parent, new_tree, message)
+                if raw is None:
+                    headers, new_message = split_object(self._read_object(commit, 'commit'))
+                new_commit = self._write_object(build_commit(headers, new_tree, new_parents, new_message), 'commit')
             else:
                 new_commit = commit  # В режиме dry-run используем оригинальный коммит
             
             return new_commit
             
+        except GitCommandError:
+            # Объект не прочитан или cat-file завершился: коммит остался бы неочищенным,
+            # поэтому очистка прерывается до обновления ссылок
+            raise
         except Exception as e:
             self.logger.warning(f"Failed to rewrite commit {commit}: {e}")
             return commit  # Возвращаем оригинальный коммит в случае ошибки
     
-    def _should_delete_file(self, path: str, blob_sha: str) -> bool:
+    def _rewrite_tree(self, tree: str) -> Tuple[str, int, int, int, int]:
+        """Переписывает корневое дерево коммита: (новое дерево, удалено, заменено, перенесено, байт)"""
+        new_tree, files_deleted, files_replaced, files_converted, bytes_removed, _ = self._rewrite_subtree(tree, '')
+        if new_tree is None:
+            new_tree = self._write_tree([])  # Удалены все файлы: корневое дерево пустое
+        return new_tree, files_deleted, files_replaced, files_converted, bytes_removed
+    
+    def _rewrite_subtree(self, tree: str, prefix: str) -> Tuple[Optional[str], int, int, int, int, Tuple[str, ...]]:
+        """Переписывает дерево каталога prefix и возвращает его новый SHA (None - каталог опустел)
+        
+        Заново записываются только каталоги, в которых что-то изменилось, и их
+        родители; SHA неизмененных поддеревьев переиспользуются как есть. Режимы
+        записей (исполняемые файлы, симлинки, submodule'и) сохраняются. Результат
+        запоминается по паре (дерево, путь), так как правила зависят от пути.
+        Последний элемент - пути перенесенных в LFS файлов, не покрытые паттернами.
+        """
+        key = (tree, prefix)
+        cached = self._tree_cache.get(key)
+        if cached is not None:
+            return cached
+        
+        new_entries = []
+        changed = False
+        files_deleted = files_replaced = files_converted = bytes_removed = 0
+        lfs_paths: List[str] = []
+        with_sizes = self.rules.needs_sizes
+        
+        for mode, name, sha in self._read_tree_entries(tree):
+            path = prefix + name
+            
+            # Подкаталог переписывается рекурсивно
+            if mode == '040000':
+                new_sha, deleted, replaced, converted, removed, sub_lfs = self._rewrite_subtree(sha, path + '/')
+                files_deleted += deleted
+                files_replaced += replaced
+                files_converted += converted
+                bytes_removed += removed
+                lfs_paths.extend(sub_lfs)
+                if new_sha != sha:
+                    changed = True
+                if new_sha is not None:
+                    new_entries.append((mode, 'tree', new_sha, name))
+                continue
+            
+            # Submodule'и переносятся как есть
+            if mode == '160000':
+                new_entries.append((mode, 'commit', sha, name))
+                continue
+            
+            size = self._get_blob_size(sha) if with_sizes else None
+            new_sha, outcome, removed = self._rewrite_blob(path, sha, size)
+            bytes_removed += removed
+            if outcome == 'deleted':
+                files_deleted += 1
+            elif outcome == 'replaced':
+                files_replaced += 1
+            elif outcome == 'converted':
+                files_converted += 1
+                if not self.rules.lfs_matches(path):
+                    lfs_paths.append(path)
+            if new_sha != sha:
+                changed = True
+            if new_sha is not None:
+                new_entries.append((mode, 'blob', new_sha, name))
+        
+        # В корне дерева .gitattributes должен отдавать перенесенные файлы в LFS
+        if not prefix and files_converted:
+            lines = [attributes_line(pattern) for pattern in self.rules.lfs_patterns]
+            lines += [attributes_line('/' + path) for path in lfs_paths]
+            if self._add_lfs_attributes(new_entries, lines):
+                changed = True
+        
+        if self.dry_run or not changed:
+            new_tree = tree  # Неизмененное дерево (и любое дерево в режиме dry-run) остается прежним
+        elif not new_entries:
+            new_tree = None
+        else:
+            new_tree = self._write_tree(new_entries)
+            # Подкаталоги созданного дерева: по ним инвентарь находит достижимые деревья
+            inventory = self._get_inventory()
+            if inventory is not None:
+                inventory.put_tree_children(new_tree, [sha for _, type_, sha, _ in new_entries if type_ == 'tree'])
+        
+        result = (new_tree, files_deleted, files_replaced, files_converted, bytes_removed, tuple(lfs_paths))
+        self._tree_cache[key] = result
+        return result
+    
+    def _rewrite_blob(self, path: str, blob_sha: str, size: Optional[int]) -> Tuple[Optional[str], str, int]:
+        """Применяет правила к одному файлу: (новый SHA или None, итог, удалено байт)
+        
+        Итог - 'deleted', 'converted', 'replaced' или 'kept'.
+        """
+        track_blobs = not self.dry_run
+        plan = self.rules.plan
+        
+        # Проверяем, нужно ли удалять файл
+        if self._should_delete_file(path, blob_sha, size):
+            if track_blobs:
+                self._removed_blobs.add(blob_sha)
+            if self.sink.wants_events:
+                self.sink.emit(BlobDeleted(path, blob_sha))
+            return None, 'deleted', 0
+        
+        # Отсутствующий в частичном клоне blob остается как есть, даже если правилам нужно его содержимое
+        if self._missing is not None and blob_sha in self._missing:
+            if plan.needs_content(path) or self._should_convert_to_lfs(path, blob_sha, size):
+                self._skipped_missing.add(blob_sha)
+            if track_blobs:
+                self._retained_blobs.add(blob_sha)
+            return blob_sha, 'kept', 0
+        
+        # Перенос в LFS: содержимое уходит в .git/lfs/objects, в дереве остается pointer-файл
+        if self._should_convert_to_lfs(path, blob_sha, size):
+            pointer_sha, saved = self._convert_to_lfs(blob_sha)
+            if track_blobs:
+                self._retained_blobs.add(pointer_sha)
+            if saved is None:
+                return blob_sha, 'kept', 0
+            if track_blobs:
+                self._removed_blobs.add(blob_sha)
+            return pointer_sha, 'converted', saved
+        
+        # Содержимое не нужно ни одному правилу, либо предварительный поиск
+        # показал, что строк для замены в blob'е нет - оставляем blob как есть
+        needle_index = self._needle_index
+        if not plan.needs_content(path) or (needle_index is not None and needle_index.can_skip(blob_sha)):
+            if track_blobs:
+                self._retained_blobs.add(blob_sha)
+            return blob_sha, 'kept', 0
+        
+        # Один и тот же blob под путями с одинаковым набором применимых замен
+        # читается и записывается один раз за запуск
+        key = (blob_sha, self.rules.replacer.applicable(path))
+        result = self._replaced_blobs.get(key)
+        if result is None:
+            result = self._replace_in_blob(blob_sha, path)
+            self._replaced_blobs[key] = result
+        new_blob_sha, outcome, _ = result
+        if track_blobs:
+            if outcome == 'replaced':
+                self._removed_blobs.add(blob_sha)
+            self._retained_blobs.add(new_blob_sha)
+        return result
+    
+    def _replace_in_blob(self, blob_sha: str, path: str) -> Tuple[str, str, int]:
+        """Читает blob, применяет замены текста и записывает результат: (SHA, итог, удалено байт)"""
+        data = self._read_blob(blob_sha)
+        new_data = self._apply_text_replacements(data, path)
+        if new_data == data:
+            return blob_sha, 'kept', 0
+        
+        # Записываем новый blob
+        if self.dry_run:
+            return blob_sha, 'replaced', len(data) - len(new_data)  # В режиме dry-run используем оригинальный SHA
+        return self._write_blob(new_data), 'replaced', len(data) - len(new_data)
+    
+    def _should_delete_file(self, path: str, blob_sha: str, size: Optional[int] = None) -> bool:
         """Проверяет, нужно ли удалить файл"""
         
-        # Удаление по имени файла
-        filename = os.path.basename(path)
-        if filename in self.files_to_delete:
+        # Удаление по SHA blob'а (не требует чтения содержимого)
+        if blob_sha in self.rules.blob_ids_to_delete:
             return True
         
-        # Удаление по паттернам
-        if self.patterns_to_delete and match_patterns(path, self.patterns_to_delete):
+        # Удаление по имени файла, паттернам и папкам
+        if self.rules.path_deleted(path):
             return True
         
         # Удаление по размеру
-        if self.size_threshold is not None:
-            try:
-                size_output = self._run_git(['cat-file', '-s', blob_sha])
-                size = int(size_output)
-                if size > self.size_threshold:
-                    return True
-            except (GitCommandError, ValueError):
-                pass
-        
-        # Удаление по имени папки
-        path_parts = Path(path).parts
-        for folder in self.folders_to_delete:
-            if folder in path_parts:
+        if self.rules.size_threshold is not None:
+            if size is None:
+                size = self._get_blob_size(blob_sha)
+            if size is not None and size > self.rules.size_threshold:
                 return True
         
         return False
     
-    def _apply_text_replacements(self,  bytes, path: str) -> bytes:
-        """Применяет замены текста к данным"""
-        if not self.text_replacements:
+    def _should_convert_to_lfs(self, path: str, blob_sha: str, size: Optional[int] = None) -> bool:
+        """Проверяет, нужно ли перенести файл в LFS"""
+        if self.rules.lfs_matches(path):
+            return True
+        if self.rules.lfs_size_threshold is not None:
+            if size is None:
+                size = self._get_blob_size(blob_sha)
+            return size is not None and size > self.rules.lfs_size_threshold
+        return False
+    
+    def _convert_to_lfs(self, blob_sha: str) -> Tuple[str, Optional[int]]:
+        """Переносит blob в LFS один раз на весь запуск: (SHA pointer-файла, сэкономлено байт)
+        
+        Blob, который уже является pointer-файлом, остается как есть: (SHA, None).
+        """
+        cached = self._lfs_pointers.get(blob_sha)
+        if cached is not None:
+            return cached
+        
+        size = self._get_blob_size(blob_sha)
+        if size is not None and size <= POINTER_MAX_SIZE and is_pointer(self._read_blob(blob_sha)):
+            result = (blob_sha, None)
+        elif self.dry_run:
+            # Pointer-файл имеет фиксированный размер, поэтому экономию можно оценить без чтения
+            result = (blob_sha, (size or 0) - len(make_pointer('0' * 64, size or 0)))
+        else:
+            if self._lfs_store is None:
+                self._lfs_store = LFSStore(self._git_dir())
+            oid, size = self._lfs_store.store(self._reader, blob_sha)
+            pointer = make_pointer(oid, size)
+            result = (self._write_blob(pointer), size - len(pointer))
+        self._lfs_pointers[blob_sha] = result
+        return result
+    
+    def _add_lfs_attributes(self, entries: List[Tuple[str, str, str, str]], lines: List[str]) -> bool:
+        """Дописывает строки LFS в корневой .gitattributes (создает его при необходимости)"""
+        for index, (mode, type_, sha, path) in enumerate(entries):
+            if path == '.gitattributes' and type_ == 'blob':
+                data = self._read_blob(sha)
+                break
+        else:
+            index, mode, sha, data = None, '100644', None, b''
+        
+        new_data = merge_attributes(data, lines)
+        if new_data == data or self.dry_run:
+            return False
+        new_sha = self._write_blob(new_data)
+        if index is None:
+            entries.append((mode, 'blob', new_sha, '.gitattributes'))
+        else:
+            entries[index] = (mode, 'blob', new_sha, '.gitattributes')
+        return True
+    
+    def _get_blob_size(self, blob_sha: str) -> Optional[int]:
+        """Возвращает размер blob'а (из кэша, инвентаря или через cat-file --batch-check)"""
+        size = self._blob_sizes.get(blob_sha)
+        if size is None:
+            if self._missing is not None and blob_sha in self._missing:
+                return None  # Размер отсутствующего blob'а неизвестен без докачки
+            inventory = self._get_inventory()
+            size = inventory.get_blob_size(blob_sha) if inventory is not None else None
+            if size is None:
+                type_, size = self._reader.info(blob_sha)
+                if type_ is None:
+                    return None
+                self._remember_blob_size(blob_sha, size)
+            else:
+                self._blob_sizes[blob_sha] = size
+        return size
+    
+    def _remember_blob_size(self, blob_sha: str, size: int):
+        """Запоминает размер blob'а в памяти и в инвентаре"""
+        self._blob_sizes[blob_sha] = size
+        inventory = self._get_inventory()
+        if inventory is not None:
+            inventory.put_blob_sizes([(blob_sha, size)])
+    
+    def _apply_text_replacements(self, data: bytes, path: str) -> bytes:
+        """Применяет замены текста (строки и регулярные выражения) к данным"""
+        if not self.rules.has_replacements:
             return data
         
         # Пропускаем бинарные файлы
@@ -211,19 +880,10 @@ class Cleaner:
         
         try:
             text_data = data.decode('utf-8')
-            modified = False
-            
-            for old_text, new_text, file_patterns in self.text_replacements:
-                # Проверяем паттерны файлов, если указаны
-                if file_patterns and not match_patterns(path, file_patterns):
-                    continue
-                
-                if old_text in text_
-                    text_data = text_data.replace(old_text, new_text)
-                    modified = True
+            new_text_data = self.rules.replacer.apply(text_data, path)
             
-            if modified:
-                return text_data.encode('utf-8')
+            if new_text_data != text_data:
+                return new_text_data.encode('utf-8')
             else:
                 return data
                 
@@ -231,108 +891,156 @@ class Cleaner:
             # Не смогли декодировать как UTF-8 - пропускаем
             return data
     
-    def _get_tree_blobs(self, tree: str) -> Dict[str, Tuple[str, str]]:
-        """Получает все blob'ы в дереве"""
-        try:
-            output = self._run_git(['ls-tree', '-r', tree])
-            blobs = {}
-            for line in output.splitlines():
-                if line:
-                    parts = line.split(None, 3)
-                    if len(parts) >= 4:
-                        mode, type_, sha, path = parts[0], parts[1], parts[2], parts[3]
-                        blobs[path] = (sha, mode)
-            return blobs
-        except GitCommandError:
-            return {}
+    def _read_tree_entries(self, tree: str) -> List[Tuple[str, str, str]]:
+        """Возвращает записи дерева (режим, имя, SHA) из кэша, инвентаря или git"""
+        entries = self._tree_entries.get(tree)
+        if entries is None:
+            inventory = self._get_inventory()
+            data = inventory.get_tree(tree) if inventory is not None else None
+            if data is None:
+                type_, data = self._reader.read(tree)
+                if type_ != 'tree':
+                    raise GitCommandError(['git', 'cat-file', '--batch'], 1, f"Tree {tree} is missing")
+                if inventory is not None:
+                    inventory.put_tree(tree, data)
+            entries = parse_tree(data, len(tree) // 2)
+            self._tree_entries[tree] = entries
+        return entries
     
     def _read_blob(self, sha: str) -> bytes:
         """Читает содержимое blob'а"""
-        try:
-            result = subprocess.run(
-                ['git', 'cat-file', 'blob', sha],
-                cwd=self.repo_path,
-                capture_output=True
-            )
-            if result.returncode == 0:
-                return result.stdout
-            else:
-                raise GitCommandError(['git', 'cat-file', 'blob', sha], result.returncode, result.stderr.decode())
-        except FileNotFoundError:
-            raise GitCommandError(['git', 'cat-file', 'blob', sha], 1, "Git not found")
+        return self._read_object(sha, 'blob')
     
-    def _write_blob(self,  bytes) -> str:
+    def _read_object(self, sha: str, expected_type: str) -> bytes:
+        """Читает сырой объект ожидаемого типа через cat-file --batch"""
+        type_, data = self._reader.read(sha)
+        if type_ is None:
+            raise GitCommandError(['git', 'cat-file', '--batch'], 1, f"Object {sha} is missing")
+        if type_ != expected_type:
+            raise GitCommandError(['git', 'cat-file', '--batch'], 1, f"Object {sha} is a {type_}, not a {expected_type}")
+        return data
+    
+    def _write_blob(self, data: bytes) -> str:
         """Записывает blob и возвращает его SHA"""
+        return self._write_object(data, 'blob')
+    
+    def _write_object(self, data: bytes, type_: str) -> str:
+        """Записывает сырой объект (blob, commit, tag) и возвращает его SHA"""
+        cmd = ['git', 'hash-object', '-t', type_, '-w', '--stdin']
         result = subprocess.run(
-            ['git', 'hash-object', '-w', '--stdin'],
+            cmd,
             cwd=self.repo_path,
+            env=self._env,
             input=data,
             capture_output=True
         )
         if result.returncode == 0:
             return result.stdout.decode().strip()
         else:
-            raise GitCommandError(['git', 'hash-object', '-w', '--stdin'], result.returncode, result.stderr.decode())
+            raise GitCommandError(cmd, result.returncode, result.stderr.decode('utf-8', 'replace'))
     
     def _write_tree(self, entries: List[Tuple[str, str, str, str]]) -> str:
-        """Создает новое дерево из записей"""
-        if not entries:
-            # Создаем пустое дерево
-            result = subprocess.run(
-                ['git', 'mktree'],
-                cwd=self.repo_path,
-                input='',
-                capture_output=True,
-                text=True
-            )
-        else:
-            mktree_input = '\n'.join([f'{mode} {type} {sha}\t{path}' for mode, type, sha, path in entries]) + '\n'
-            result = subprocess.run(
-                ['git', 'mktree'],
-                cwd=self.repo_path,
-                input=mktree_input,
-                capture_output=True,
-                text=True
-            )
-        
-        if result.returncode == 0:
-            return result.stdout.strip()
-        else:
-            raise GitCommandError(['git', 'mktree'], result.returncode, result.stderr)
-    
-    def _write_commit(self, parent: Optional[str], tree: str, message: str) -> str:
-        """Создает новый коммит"""
-        cmd = ['commit-tree', tree]
-        if parent:
-            cmd.extend(['-p', parent])
-        cmd.extend(['-m', message])
-        
+        """Создает дерево одного каталога из записей (режим, тип, SHA, имя)"""
+        # -z: имена могут содержать любые символы, кроме NUL
+        mktree_input = b''.join(f'{mode} {type_} {sha}\t'.encode() + name.encode('utf-8', 'surrogateescape') + b'\0'
+                                for mode, type_, sha, name in entries)
+        # В частичном клоне дерево может ссылаться на blob'ы, которых нет локально
+        cmd = ['git', 'mktree', '-z'] + (['--missing'] if self.partial_clone else [])
         result = subprocess.run(
-            ['git'] + cmd,
+            cmd,
             cwd=self.repo_path,
-            capture_output=True,
-            text=True
+            env=self._env,
+            input=mktree_input,
+            capture_output=True
         )
         
         if result.returncode == 0:
-            return result.stdout.strip()
+            return result.stdout.decode().strip()
         else:
-            raise GitCommandError(['git'] + cmd, result.returncode, result.stderr)
+            raise GitCommandError(cmd, result.returncode, result.stderr.decode('utf-8', 'replace'))
     
-    def _get_commit_parent(self, commit: str) -> Optional[str]:
-        """Получает родительский коммит"""
+    def _save_run_mapping(self, commit_map: Dict[str, str]) -> BlobIdSet:
+        """Сохраняет карту коммитов и удаленные blob'ы в .git/gitcleaner и возвращает удаленные
+        
+        Blob, убранный по одному пути, но оставшийся по другому, удаленным не считается.
+        """
+        purged = self._removed_blobs - self._retained_blobs
         try:
-            output = self._run_git(['rev-parse', f'{commit}^'])
-            return output if output else None
-        except GitCommandError:
-            return None
+            save_run_mapping(self._git_dir() / 'gitcleaner', commit_map, purged)
+            self.logger.info(f"Saved run mapping: {len(commit_map)} commits, {len(purged)} purged blobs")
+        except (OSError, GitCommandError) as e:
+            self.logger.warning(f"Failed to save run mapping: {e}")
+        return purged
     
-    def _get_commit_message(self, commit: str) -> str:
-        """Получает сообщение коммита"""
+    def _prune_inventory(self, purged: BlobIdSet):
+        """Убирает из инвентаря переписанную историю: коммиты, деревья и размеры удаленных blob'ов
+        
+        Иначе в .git/gitcleaner остались бы имена и SHA удаленных файлов.
+        """
+        self._inventory_graph_synced = False
+        inventory = self._inventory_graph()
+        if inventory is None:
+            return
         try:
-            return self._run_git(['log', '--format=%B', '-n', '1', commit])
-        except GitCommandError:
-            return "No message"
+            inventory.forget_blobs(purged)
+        except sqlite3.Error as e:
+            self.logger.warning(f"Failed to prune object inventory: {e}")
+    
+    def verify_purged(self, purged_file: Optional[Union[str, Path]] = None,
+                      secrets: Optional[Iterable[str]] = None, workers: int = 4) -> Dict[str, any]:
+        """Проверяет, что удаленные blob'ы и строки недостижимы из ссылок
+        
+        Один потоковый проход rev-list --objects --all сверяется со списком
+        blob'ов, удаленных при последнем запуске. Если заданы строки, все
+        достижимые blob'ы параллельно проверяются на их наличие; blob'ы,
+        уже проверенные предварительным поиском и не содержащие строк, не читаются.
+        """
+        if purged_file is None:
+            purged_file = self._git_dir() / 'gitcleaner' / PURGED_BLOBS_FILE
+        purged = load_blob_ids(purged_file)
+        
+        index = NeedleIndex(secrets or ())
+        if index:
+            index.load(self._git_dir() / 'gitcleaner' / f'needles-{index.key}.idx')
+        
+        # Один потоковый конвейер: rev-list -> cat-file --batch-check -> поиск строк,
+        # в памяти остаются только счетчики и найденное
+        counts = {'objects': 0, 'blobs': 0}
+        leaked = []
+        
+        def named_objects() -> Iterator[Tuple[str, str]]:
+            for line in self._stream_git(['rev-list', '--objects', '--all']):
+                counts['objects'] += 1
+                sha, _, path = line.partition(' ')
+                if sha in purged:
+                    leaked.append({'sha': sha, 'path': path})
+                if path:
+                    yield sha, path
+        
+        def candidates() -> Iterator[Tuple[str, Tuple[str, str]]]:
+            # Только blob'ы, которые предварительный поиск еще не видел или нашел в них строки
+            for path, sha, type_, _ in self._reader.iter_info(named_objects()):
+                if type_ == 'blob' and not index.can_skip(sha):
+                    counts['blobs'] += 1
+                    yield sha, (sha, path)
+        
+        secrets_found = []
+        if index:
+            secrets_found = [{'sha': sha, 'path': path}
+                             for sha, path in index.find_parallel(self.repo_path, candidates(), workers)]
+            self._reader.close()
+        else:
+            for _ in named_objects():
+                pass
+        
+        return {
+            'objects_checked': counts['objects'],
+            'purged_blobs': len(purged),
+            'leaked': leaked,
+            'blobs_scanned': counts['blobs'],
+            'secrets_found': secrets_found,
+            'clean': not leaked and not secrets_found,
+        }
     
     def _update_refs(self, commit_map: Dict[str, str]):
         """Обновляет ссылки на новые коммиты"""
@@ -351,17 +1059,95 @@ class Cleaner:
                     new_sha = commit_map[old_sha]
                     if new_sha != old_sha:
                         self._run_git(['update-ref', ref_name, new_sha])
+                        if self.sink.wants_events:
+                            self.sink.emit(RefUpdated(ref_name, old_sha, new_sha))
                         self.logger.info(f"Updated {ref_name} from {old_sha[:8]} to {new_sha[:8]}")
         
         except GitCommandError as e:
             self.logger.warning(f"Failed to update refs: {e}")
     
+    def _rewrite_tags(self, commit_map: Dict[str, str]):
+        """Переносит теги на переписанные коммиты и очищает сообщения аннотированных тегов
+        
+        Легкий тег переводится на новый коммит. Аннотированный тег пересобирается
+        из сырого объекта, если изменился его коммит или сообщение: автор тега
+        сохраняется, подпись отбрасывается.
+        """
+        fmt = '%(objectname) %(objecttype) %(refname)'
+        try:
+            refs = [line.split(' ', 2) for line in self._stream_git(['for-each-ref', f'--format={fmt}', 'refs/tags'])]
+            updates = [(ref, sha, commit_map[sha]) for sha, type_, ref in refs
+                       if type_ == 'commit' and sha in commit_map]
+            annotated = ((sha, (sha, ref)) for sha, type_, ref in refs if type_ == 'tag')
+            for (sha, ref), _, type_, raw in self._reader.iter_tagged_objects(annotated):
+                if type_ != 'tag':
+                    continue
+                headers, message = split_object(raw)
+                target = next((header[7:].decode() for header in headers if header.startswith(b'object ')), None)
+                new_target = commit_map.get(target, target)
+                new_message = self._scrub_message(message, headers)
+                if new_message != message:
+                    self.stats['messages_replaced'] += 1
+                if new_target == target and new_message == message:
+                    continue
+                new_sha = sha if self.dry_run else self._write_object(build_tag(headers, new_target, new_message), 'tag')
+                updates.append((ref, sha, new_sha))
+            
+            self.stats['tags_rewritten'] += len(updates)
+            if self.dry_run:
+                return
+            for ref, old_sha, new_sha in updates:
+                self._run_git(['update-ref', ref, new_sha, old_sha])
+                if self.sink.wants_events:
+                    self.sink.emit(RefUpdated(ref, old_sha, new_sha))
+                self.logger.info(f"Updated {ref} from {old_sha[:8]} to {new_sha[:8]}")
+        except GitCommandError as e:
+            self.logger.warning(f"Failed to rewrite tags: {e}")
+    
+    def _stream_git(self, args: List[str], input_text: Optional[str] = None) -> Iterator[str]:
+        """Выполняет Git команду и построчно отдает ее вывод"""
+        cmd = ['git'] + args
+        # stderr пишется во временный файл, чтобы не заблокировать процесс на заполненном канале
+        with tempfile.TemporaryFile() as stderr_file:
+            proc = subprocess.Popen(
+                cmd,
+                cwd=self.repo_path,
+                env=self._env,
+                stdin=subprocess.PIPE if input_text is not None else subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=stderr_file,
+                text=True,
+                encoding='utf-8',
+                # Пути в Git - байты: не-UTF-8 имена проходят без потерь и кодируются обратно так же
+                errors='surrogateescape'
+            )
+            completed = False
+            try:
+                # Git читает весь stdin (--stdin) до начала вывода
+                if input_text is not None:
+                    proc.stdin.write(input_text)
+                    proc.stdin.close()
+                for line in proc.stdout:
+                    line = line.rstrip('\n')
+                    if line:
+                        yield line
+                completed = True
+            finally:
+                proc.stdout.close()
+                if not completed:
+                    proc.kill()
+                proc.wait()
+            if proc.returncode != 0:
+                stderr_file.seek(0)
+                raise GitCommandError(cmd, proc.returncode, stderr_file.read().decode('utf-8', 'replace'))
+    
     def _run_git(self, args: List[str]) -> str:
         """Выполняет Git команду"""
         cmd = ['git'] + args
         result = subprocess.run(
             cmd,
             cwd=self.repo_path,
+            env=self._env,
             capture_output=True,
             text=True
         )
@@ -369,6 +1155,13 @@ class Cleaner:
             raise GitCommandError(cmd, result.returncode, result.stderr)
         return result.stdout.strip()
     
+    def count_commits(self) -> int:
+        """Считает коммиты репозитория (через инвентарь, если он включен)"""
+        try:
+            return self._count_commits(self.revisions)
+        finally:
+            self._close_inventory()
+    
     def get_stats(self) -> Dict[str, any]:
         """Получает текущую статистику"""
         return self.stats.copy()
\ No newline at end of file
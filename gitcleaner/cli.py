@@ -4,27 +4,119 @@ CLI интерфейс для GitCleaner
 
 import os
 import sys
-import logging
+import subprocess
+from functools import lru_cache
 from pathlib import Path
+from typing import List
 import click
-from colorama import init, Fore, Style
 
-from .core import GitCleaner
-from .exceptions import GitCleanerError
-from .utils import human_readable_size, parse_size
+from . import __version__
+from .rules import RuleSet
+from .exceptions import GitCleanerError, GitRepositoryError, GitCommandError
+from .utils import human_readable_size, parse_size, load_blob_ids
 
-# Инициализация colorama
-init(autoreset=True)
+# Тяжелые модули (colorama, core, fleet, tqdm, logging, json) загружаются только командами,
+# которым они нужны: CLI вызывается из hook'ов и CI тысячи раз в день, и время запуска важно
 
-# Настройка логгирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+@lru_cache(maxsize=None)
+def _colorama():
+    """Загружает и инициализирует colorama при первом выводе в цвете"""
+    import colorama
+    colorama.init(autoreset=True)
+    return colorama
+
+class _LazyColors:
+    """Цвета colorama (Fore, Style), загружаемые при первом обращении"""
+
+    def __init__(self, name: str):
+        self._name = name
+
+    def __getattr__(self, attr: str) -> str:
+        return getattr(getattr(_colorama(), self._name), attr)
+
+Fore = _LazyColors('Fore')
+Style = _LazyColors('Style')
+
+def setup_logging(verbose: bool = False):
+    """Настраивает логгирование для команд, которые пишут в лог"""
+    import logging
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    if verbose:
+        logging.getLogger().setLevel(logging.DEBUG)
+
+def rule_options(func):
+    """Опции правил очистки, общие для clean, fleet и hook"""
+    options = [
+        click.option('--rules', 'rules_file', type=click.Path(exists=True, dir_okay=False),
+                     help='Файл правил (компилируется один раз, кэш сохраняется рядом с файлом)'),
+        click.option('-f', '--file', multiple=True, help='Имена файлов для удаления'),
+        click.option('--pattern', multiple=True, help='Паттерны файлов для удаления (glob)'),
+        click.option('--size', help='Удалить файлы больше указанного размера (например: 100MB, 1.5GB)'),
+        click.option('--folder', multiple=True, help='Имена папок для удаления'),
+        click.option('--blob-ids', type=click.Path(exists=True, dir_okay=False), help='Файл со списком SHA blob\'ов для удаления'),
+        click.option('--replace-old', help='Текст для замены'),
+        click.option('--replace-new', help='Новый текст'),
+        click.option('--replace-files', help='Паттерны файлов для замены текста'),
+        click.option('--lfs', multiple=True, help='Паттерны файлов для переноса в Git LFS'),
+        click.option('--lfs-size', help='Перенести в Git LFS файлы больше указанного размера'),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+def load_rules(rules_file) -> RuleSet:
+    """Загружает файл правил или создает пустой набор"""
+    if not rules_file:
+        return RuleSet()
+    from .rulefile import load_rules_file
+    return load_rules_file(rules_file)
+
+def build_rules(rules_file, file, pattern, size, folder, blob_ids, replace_old, replace_new, replace_files,
+                lfs, lfs_size) -> RuleSet:
+    """Собирает набор правил из опций rule_options (опции дополняют файл правил)"""
+    rules = load_rules(rules_file)
+    if file:
+        rules.delete_files_by_name(list(file))
+    if pattern:
+        rules.delete_files_by_pattern(list(pattern))
+    if size:
+        rules.delete_files_larger_than(parse_size(size))
+    if folder:
+        rules.delete_folders(list(folder))
+    if blob_ids:
+        rules.delete_blobs_by_id(load_blob_ids(blob_ids))
+    if replace_old and replace_new is not None:
+        file_patterns = replace_files.split(',') if replace_files else None
+        rules.replace_text_in_files(replace_old, replace_new, file_patterns)
+    if lfs or lfs_size:
+        rules.convert_to_lfs(list(lfs), parse_size(lfs_size) if lfs_size else None)
+    return rules
+
+def describe_rules(rules: RuleSet) -> List[str]:
+    """Краткое описание набора правил для вывода перед очисткой"""
+    lines = []
+    if rules.files_to_delete:
+        lines.append(f"Файлов для удаления: {len(rules.files_to_delete)}")
+    if rules.patterns_to_delete:
+        lines.append(f"Паттернов для удаления: {len(rules.patterns_to_delete)}")
+    if rules.size_threshold is not None:
+        lines.append(f"Порог размера: {human_readable_size(rules.size_threshold)}")
+    if rules.folders_to_delete:
+        lines.append(f"Папок для удаления: {len(rules.folders_to_delete)}")
+    if rules.blob_ids_to_delete:
+        lines.append(f"Blob'ов для удаления: {len(rules.blob_ids_to_delete)}")
+    replacements = len(rules.text_replacements) + len(rules.regex_replacements)
+    if replacements:
+        lines.append(f"Правил замены текста: {replacements}")
+    if rules.lfs_patterns or rules.lfs_size_threshold is not None:
+        lines.append(f"Паттернов для переноса в LFS: {len(rules.lfs_patterns)}")
+    return lines
 
 @click.group()
-@click.version_option()
+@click.version_option(__version__, prog_name='GitCleaner')
 def main():
     """GitCleaner - Аналог BFG Repo-Cleaner на Python"""
     pass
@@ -35,16 +127,16 @@ def main():
 @click.option('-v', '--verbose', is_flag=True, help='Подробный вывод')
 def stats(path, dry_run, verbose):
     """Показать статистику репозитория"""
+    from .core import GitCleaner
+    setup_logging(verbose)
     try:
-        if verbose:
-            logging.getLogger().setLevel(logging.DEBUG)
-        
         cleaner = GitCleaner(path, dry_run)
         stats = cleaner.get_stats()
         
         click.echo(f"{Fore.CYAN}Статистика репозитория:{Style.RESET_ALL}")
         click.echo(f"  Путь: {path}")
         click.echo(f"  Режим dry-run: {'Да' if dry_run else 'Нет'}")
+        click.echo(f"  Коммитов: {cleaner.count_commits()}")
         click.echo()
         click.echo(f"{Fore.GREEN}Статистика:{Style.RESET_ALL}")
         for key, value in stats.items():
@@ -57,48 +149,51 @@ def stats(path, dry_run, verbose):
 @main.command()
 @click.option('-p', '--path', default='.', help='Путь к Git репозиторию')
 @click.option('--dry-run', is_flag=True, help='Режим пробного запуска (без изменений)')
-@click.option('-f', '--file', multiple=True, help='Имена файлов для удаления')
-@click.option('--pattern', multiple=True, help='Паттерны файлов для удаления (glob)')
-@click.option('--size', help='Удалить файлы больше указанного размера (например: 100MB, 1.5GB)')
-@click.option('--folder', multiple=True, help='Имена папок для удаления')
-@click.option('--replace-old', help='Текст для замены')
-@click.option('--replace-new', help='Новый текст')
-@click.option('--replace-files', help='Паттерны файлов для замены текста')
+@rule_options
+@click.option('--revs', multiple=True, help='Переписать только эти ревизии (например: v3.0..main)')
+@click.option('--branches', multiple=True, help='Переписать только ветки по маске (например: release/*)')
+@click.option('--max-memory', help='Ограничить память кэшей (например: 512MB, 2GB)')
+@click.option('--no-cache', is_flag=True, help='Не использовать инвентарь объектов в .git/gitcleaner')
+@click.option('--missing-blobs', type=click.Choice(['prefetch', 'skip']), default='prefetch', show_default=True,
+              help='Частичный клон: докачать одним запросом нужные правилам blob\'ы или пропустить их')
+@click.option('--keep-messages', is_flag=True, help='Не применять замены к сообщениям коммитов и тегов')
 @click.option('-v', '--verbose', is_flag=True, help='Подробный вывод')
-def clean(path, dry_run, file, pattern, size, folder, replace_old, replace_new, replace_files, verbose):
+def clean(path, dry_run, rules_file, file, pattern, size, folder, blob_ids, replace_old, replace_new,
+          replace_files, lfs, lfs_size, revs, branches, max_memory, no_cache, missing_blobs, keep_messages, verbose):
     """Очистить репозиторий"""
+    from .core import GitCleaner
+    setup_logging(verbose)
     try:
-        if verbose:
-            logging.getLogger().setLevel(logging.DEBUG)
+        # Те же правила и та же семантика опций, что у fleet и hook
+        rules = build_rules(rules_file, file, pattern, size, folder, blob_ids, replace_old, replace_new,
+                            replace_files, lfs, lfs_size)
+        cleaner = GitCleaner(path, dry_run, rules=rules)
+        if rules_file:
+            click.echo(f"{Fore.GREEN}Загружены правила из файла: {rules_file}{Style.RESET_ALL}")
+        for line in describe_rules(rules):
+            click.echo(f"{Fore.GREEN}{line}{Style.RESET_ALL}")
         
-        cleaner = GitCleaner(path, dry_run)
+        # Ограничение диапазона ревизий
+        revisions = list(revs) + [f'--branches={mask}' for mask in branches]
+        if revisions:
+            result = cleaner.limit_to_revisions(revisions)
+            click.echo(f"{Fore.GREEN}Добавлено ревизий для переписывания: {result['revisions_added']}{Style.RESET_ALL}")
         
-        # Добавляем файлы для удаления
-        if file:
-            result = cleaner.delete_files_by_name(list(file))
-            click.echo(f"{Fore.GREEN}Добавлено файлов для удаления: {result['files_added']}{Style.RESET_ALL}")
-        
-        # Добавляем паттерны для удаления
-        if pattern:
-            result = cleaner.delete_files_by_pattern(list(pattern))
-            click.echo(f"{Fore.GREEN}Добавлено паттернов для удаления: {result['patterns_added']}{Style.RESET_ALL}")
-        
-        # Удаление по размеру
-        if size:
-            result = cleaner.delete_files_larger_than(size)
-            size_bytes = result['size_threshold']
-            click.echo(f"{Fore.GREEN}Установлен порог размера: {human_readable_size(size_bytes)}{Style.RESET_ALL}")
-        
-        # Удаление папок
-        if folder:
-            result = cleaner.delete_folders(list(folder))
-            click.echo(f"{Fore.GREEN}Добавлено папок для удаления: {result['folders_added']}{Style.RESET_ALL}")
-        
-        # Замена текста
-        if replace_old and replace_new:
-            file_patterns = replace_files.split(',') if replace_files else None
-            result = cleaner.replace_text_in_files(replace_old, replace_new, file_patterns)
-            click.echo(f"{Fore.GREEN}Добавлено правил замены текста: {result['replacements_added']}{Style.RESET_ALL}")
+        # Инвентарь объектов
+        if no_cache:
+            cleaner.cleaner.use_inventory = False
+        cleaner.cleaner.missing_blobs = missing_blobs
+        cleaner.cleaner.scrub_messages = not keep_messages
+        
+        # Ограничение памяти
+        if max_memory:
+            cleaner.set_memory_limit(max_memory)
+        
+        # Показываем план чтения
+        if verbose:
+            click.echo(f"\n{Fore.CYAN}План чтения:{Style.RESET_ALL}")
+            for line in cleaner.plan_cleanup().describe():
+                click.echo(f"  {line}")
         
         # Выполняем очистку
         click.echo(f"\n{Fore.YELLOW}Начинаем очистку...{Style.RESET_ALL}")
@@ -110,8 +205,20 @@ def clean(path, dry_run, file, pattern, size, folder, replace_old, replace_new,
         click.echo(f"  Обработано коммитов: {stats['commits_processed']}")
         click.echo(f"  Удалено файлов: {stats['files_deleted']}")
         click.echo(f"  Заменено файлов: {stats['files_replaced']}")
+        click.echo(f"  Перенесено в LFS: {stats['files_converted']}")
         click.echo(f"  Удалено данных: {human_readable_size(stats['bytes_removed'])}")
         click.echo(f"  Переписано коммитов: {stats['commits_rewritten']}")
+        click.echo(f"  Очищено сообщений коммитов и тегов: {stats['messages_replaced']}")
+        click.echo(f"  Перенесено тегов: {stats['tags_rewritten']}")
+        if stats['blobs_missing']:
+            click.echo(f"{Fore.YELLOW}  Пропущено отсутствующих в частичном клоне blob'ов: {stats['blobs_missing']}{Style.RESET_ALL}")
+        
+        # Статистика кэшей
+        if max_memory or verbose:
+            click.echo(f"\n{Fore.CYAN}Кэши:{Style.RESET_ALL}")
+            for name, cache in result['cache_stats'].items():
+                click.echo(f"  {name}: записей {cache['entries']}, {human_readable_size(cache['bytes'])}, "
+                           f"попаданий {cache['hits']}, промахов {cache['misses']}, вытеснено {cache['evictions']}")
         
         if dry_run:
             click.echo(f"\n{Fore.YELLOW}Это был пробный запуск. Никаких изменений не было сделано.{Style.RESET_ALL}")
@@ -129,22 +236,38 @@ def clean(path, dry_run, file, pattern, size, folder, replace_old, replace_new,
 
 @main.command()
 @click.option('-p', '--path', default='.', help='Путь к Git репозиторию')
-def verify(path):
+@click.option('--purged', is_flag=True, help='Проверить, что удаленные при очистке объекты недостижимы')
+@click.option('--purged-file', type=click.Path(exists=True, dir_okay=False),
+              help='Список удаленных blob\'ов (по умолчанию - из последнего запуска)')
+@click.option('--secret', multiple=True, help='Строка, которой не должно остаться в истории')
+@click.option('-j', '--workers', default=4, show_default=True, type=click.IntRange(min=1),
+              help='Сколько процессов читают blob\'ы при поиске строк')
+def verify(path, purged, purged_file, secret, workers):
     """Проверить, что репозиторий готов для очистки"""
     try:
-        cleaner = GitCleaner(path)
+        if purged or purged_file or secret:
+            from .core import GitCleaner
+            setup_logging()
+            _verify_purged(GitCleaner(path), purged_file, list(secret), workers)
+            return
+        
+        # Легкие проверки без загрузки core и без перечисления коммитов
+        try:
+            _git(path, ['rev-parse', '--git-dir'])
+        except GitCommandError:
+            raise GitRepositoryError(f"Not a git repository: {path}")
         click.echo(f"{Fore.GREEN}✓{Style.RESET_ALL} Репозиторий найден: {path}")
         click.echo(f"{Fore.GREEN}✓{Style.RESET_ALL} Git доступен")
         
         # Проверяем наличие коммитов
-        commits = cleaner.cleaner._get_all_commits()
-        click.echo(f"{Fore.GREEN}✓{Style.RESET_ALL} Найдено коммитов: {len(commits)}")
+        commits = int(_git(path, ['rev-list', '--count', '--all']) or 0)
+        click.echo(f"{Fore.GREEN}✓{Style.RESET_ALL} Найдено коммитов: {commits}")
         
         # Проверяем текущую ветку
         try:
-            branch = cleaner.cleaner._run_git(['rev-parse', '--abbrev-ref', 'HEAD'])
+            branch = _git(path, ['rev-parse', '--abbrev-ref', 'HEAD'])
             click.echo(f"{Fore.GREEN}✓{Style.RESET_ALL} Текущая ветка: {branch}")
-        except:
+        except GitCommandError:
             pass
             
         click.echo(f"\n{Fore.GREEN}Репозиторий готов для очистки!{Style.RESET_ALL}")
@@ -152,6 +275,146 @@ def verify(path):
     except GitCleanerError as e:
         click.echo(f"{Fore.RED}Ошибка: {e}{Style.RESET_ALL}", err=True)
         sys.exit(1)
+    except OSError as e:
+        click.echo(f"{Fore.RED}Нет данных о последней очистке: {e}{Style.RESET_ALL}", err=True)
+        sys.exit(1)
+    except Exception as e:
+        click.echo(f"{Fore.RED}Неожиданная ошибка: {e}{Style.RESET_ALL}", err=True)
+        sys.exit(1)
+
+def _git(path: str, args) -> str:
+    """Выполняет легкую команду git, не загружая core"""
+    if not os.path.isdir(path):
+        raise GitRepositoryError(f"Not a git repository: {path}")
+    cmd = ['git'] + args
+    try:
+        result = subprocess.run(cmd, cwd=path, capture_output=True, text=True)
+    except FileNotFoundError:
+        raise GitRepositoryError("Git is not installed or not in PATH")
+    if result.returncode != 0:
+        raise GitCommandError(cmd, result.returncode, result.stderr)
+    return result.stdout.strip()
+
+def _display_path(path: str) -> str:
+    """Путь для вывода: байты имени, не являющиеся UTF-8, заменяются знаком '�'"""
+    return path.encode('utf-8', 'surrogateescape').decode('utf-8', 'replace')
+
+def _verify_purged(cleaner, purged_file, secrets, workers):
+    """Проверяет результаты очистки и завершает процесс с кодом 1 при утечке"""
+    result = cleaner.verify_purged(purged_file, secrets, workers)
+    click.echo(f"Проверено объектов: {result['objects_checked']}")
+    click.echo(f"Удаленных blob'ов в списке: {result['purged_blobs']}")
+    if secrets:
+        click.echo(f"Прочитано blob'ов при поиске строк: {result['blobs_scanned']}")
+    
+    for leak in result['leaked']:
+        click.echo(f"{Fore.RED}✗{Style.RESET_ALL} Удаленный blob достижим: {leak['sha']} {_display_path(leak['path'])}")
+    for found in result['secrets_found']:
+        click.echo(f"{Fore.RED}✗{Style.RESET_ALL} Найдена строка: {found['sha']} {_display_path(found['path'])}")
+    
+    if not result['clean']:
+        click.echo(f"\n{Fore.RED}Удаленные данные все еще достижимы!{Style.RESET_ALL}", err=True)
+        sys.exit(1)
+    click.echo(f"\n{Fore.GREEN}✓{Style.RESET_ALL} Удаленные объекты недостижимы")
+
+@main.command()
+@click.option('-m', '--manifest', required=True, type=click.Path(exists=True, dir_okay=False),
+              help='Файл со списком путей к репозиториям (по одному на строку)')
+@click.option('-j', '--workers', default=4, show_default=True, type=click.IntRange(min=1),
+              help='Сколько репозиториев обрабатывать одновременно')
+@click.option('--per-repo-limit', default=1, show_default=True, type=click.IntRange(min=1),
+              help='Сколько проверок одного хранилища объектов одновременно (с --dry-run)')
+@click.option('--dry-run', is_flag=True, help='Режим пробного запуска (без изменений)')
+@rule_options
+@click.option('--max-memory', help='Общий бюджет памяти кэшей для всех воркеров (например: 2GB)')
+@click.option('--report', type=click.Path(dir_okay=False), help='Сохранить сводный отчет в JSON файл')
+@click.option('-v', '--verbose', is_flag=True, help='Подробный вывод')
+def fleet(manifest, workers, per_repo_limit, dry_run, rules_file, file, pattern, size, folder, blob_ids,
+          replace_old, replace_new, replace_files, lfs, lfs_size, max_memory, report, verbose):
+    """Очистить множество репозиториев одним набором правил"""
+    from .fleet import FleetCleaner, load_manifest
+    setup_logging(verbose)
+    try:
+        # Правила разбираются один раз для всех репозиториев
+        rules = build_rules(rules_file, file, pattern, size, folder, blob_ids, replace_old, replace_new,
+                            replace_files, lfs, lfs_size)
+        
+        repos = load_manifest(manifest)
+        click.echo(f"{Fore.YELLOW}Репозиториев в манифесте: {len(repos)}{Style.RESET_ALL}")
+        memory_limit = parse_size(max_memory) if max_memory else None
+        result = FleetCleaner(repos, rules, dry_run, workers, per_repo_limit, memory_limit).run()
+        
+        # Показываем результаты по репозиториям
+        for repo in result['repos']:
+            if repo['status'] == 'ok':
+                stats = repo['stats']
+                click.echo(f"{Fore.GREEN}✓{Style.RESET_ALL} {repo['path']}: "
+                           f"коммитов {stats['commits_processed']}, удалено файлов {stats['files_deleted']}, "
+                           f"заменено {stats['files_replaced']} ({repo['duration']:.1f}s)")
+            else:
+                click.echo(f"{Fore.RED}✗{Style.RESET_ALL} {repo['path']}: {repo['error']}")
+        
+        totals = result['totals']
+        click.echo(f"\n{Fore.CYAN}Сводные результаты:{Style.RESET_ALL}")
+        click.echo(f"  Успешно: {result['succeeded']}, с ошибками: {result['failed']}")
+        click.echo(f"  Обработано коммитов: {totals.get('commits_processed', 0)}")
+        click.echo(f"  Удалено файлов: {totals.get('files_deleted', 0)}")
+        click.echo(f"  Заменено файлов: {totals.get('files_replaced', 0)}")
+        click.echo(f"  Перенесено в LFS: {totals.get('files_converted', 0)}")
+        click.echo(f"  Удалено данных: {human_readable_size(totals.get('bytes_removed', 0))}")
+        click.echo(f"  Время: {result['duration']:.1f}s")
+        
+        if report:
+            import json
+            with open(report, 'w', encoding='utf-8') as fh:
+                json.dump(result, fh, ensure_ascii=False, indent=2)
+        
+        if result['failed']:
+            sys.exit(1)
+    
+    except (GitCleanerError, ValueError, OSError) as e:
+        click.echo(f"{Fore.RED}Ошибка: {e}{Style.RESET_ALL}", err=True)
+        sys.exit(1)
+
+@main.group()
+def hook():
+    """Серверные hook'и, отклоняющие push'и по правилам очистки"""
+    pass
+
+HOOK_REASONS = {
+    'blob_id': 'blob из списка запрещенных',
+    'path': 'запрещенный путь',
+    'size': 'превышен размер',
+    'lfs': 'файл должен храниться в Git LFS',
+    'secret': 'содержит запрещенную строку',
+}
+
+@hook.command('pre-receive')
+@click.option('-p', '--path', default='.', help='Путь к Git репозиторию')
+@rule_options
+def pre_receive(path, rules_file, file, pattern, size, folder, blob_ids, replace_old, replace_new,
+                replace_files, lfs, lfs_size):
+    """Проверить новые объекты push'а (ссылки читаются из stdin)
+
+    Строки --replace-old и замены из файла правил считаются запрещенными,
+    --replace-new не обязателен.
+    """
+    from .hook import PushChecker, parse_ref_updates
+    try:
+        rules = build_rules(rules_file, file, pattern, size, folder, blob_ids, replace_old,
+                            replace_new if replace_new is not None else '', replace_files, lfs, lfs_size)
+        violations = PushChecker(path, rules).check(parse_ref_updates(sys.stdin))
+    except Exception as e:
+        # Hook отказывает при любой ошибке: непроверенный push не принимается
+        click.echo(f"gitcleaner: ошибка проверки: {e}", err=True)
+        sys.exit(1)
+    
+    for violation in violations:
+        click.echo(f"gitcleaner: {_display_path(violation['path'])} ({violation['sha'][:12]}): "
+                   f"{HOOK_REASONS[violation['reason']]}", err=True)
+    if violations:
+        click.echo(f"gitcleaner: push отклонен, нарушений: {len(violations)}", err=True)
+        sys.exit(1)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -3,30 +3,36 @@
 """
 
 import os
+import queue
 import subprocess
+import threading
 import logging
-from typing import List, Dict, Set, Optional, Callable
+from typing import List, Dict, Set, Optional, Callable, Iterable, Iterator, Union
 from pathlib import Path
-from tqdm import tqdm
 
 from .cleaner import Cleaner
+from .rules import RuleSet
+from .events import EventSink, CallbackSink, CleanupFinished
 from .exceptions import GitRepositoryError, GitCommandError
-from .utils import parse_size, human_readable_size
+from .utils import parse_size, human_readable_size, load_blob_ids
 
 class GitCleaner:
     """Основной класс для очистки Git репозитория"""
     
-    def __init__(self, repo_path: str = ".", dry_run: bool = False):
+    def __init__(self, repo_path: str = ".", dry_run: bool = False, rules: Optional[RuleSet] = None,
+                 sink: Optional[EventSink] = None):
         """
         Инициализация GitCleaner
         
         Args:
             repo_path: Путь к Git репозиторию
             dry_run: Режим "пробного" запуска (без изменений)
+            rules: Готовый набор правил (например, общий для нескольких репозиториев)
+            sink: Приемник событий прогресса (по умолчанию - прогресс-бар tqdm)
         """
         self.repo_path = Path(repo_path).resolve()
         self.dry_run = dry_run
-        self.cleaner = Cleaner(repo_path, dry_run)
+        self.cleaner = Cleaner(repo_path, dry_run, rules, sink)
         
         # Настройка логгирования
         self.logger = logging.getLogger(__name__)
@@ -43,7 +49,7 @@ class GitCleaner:
         except GitCommandError:
             return False
     
-    def _run_git(self, args: List[str], input_ Optional[str] = None) -> str:
+    def _run_git(self, args: List[str], input_data: Optional[str] = None) -> str:
         """Выполняет Git команду"""
         cmd = ['git'] + args
         try:
@@ -130,6 +136,97 @@ class GitCleaner:
         self.logger.info(f"Deleting folders: {folder_names}")
         return self.cleaner.delete_folders(folder_names)
     
+    def convert_to_lfs(self, patterns: Optional[List[str]] = None,
+                       size_str: Optional[str] = None) -> Dict[str, int]:
+        """
+        Переносит файлы в Git LFS: в истории остаются pointer-файлы
+        
+        Содержимое копируется в .git/lfs/objects, а в корневой .gitattributes
+        каждого переписанного дерева добавляются правила LFS.
+        
+        Args:
+            patterns: Паттерны файлов для переноса
+            size_str: Переносить файлы больше указанного размера ('10MB', '1.5GB')
+            
+        Returns:
+            Словарь с информацией о добавленных правилах
+        """
+        size_bytes = parse_size(size_str) if size_str is not None else None
+        self.logger.info(f"Converting files to LFS: patterns={patterns}, size={size_str}")
+        return self.cleaner.convert_to_lfs(patterns, size_bytes)
+    
+    def delete_blobs_by_id(self, blob_ids: Iterable[str]) -> Dict[str, int]:
+        """
+        Удаляет blob'ы по их SHA, где бы они ни встречались
+        
+        Args:
+            blob_ids: Список SHA blob'ов для удаления
+            
+        Returns:
+            Словарь с информацией о добавленных blob'ах
+        """
+        self.logger.info("Deleting blobs by id")
+        return self.cleaner.delete_blobs_by_id(blob_ids)
+    
+    def delete_blobs_from_file(self, ids_file: Union[str, Path]) -> Dict[str, int]:
+        """
+        Удаляет blob'ы, SHA которых перечислены в файле (по одному на строку)
+        
+        Args:
+            ids_file: Путь к файлу со списком SHA
+            
+        Returns:
+            Словарь с информацией о добавленных blob'ах
+        """
+        self.logger.info(f"Loading blob ids from {ids_file}")
+        return self.cleaner.delete_blobs_by_id(load_blob_ids(ids_file))
+    
+    def limit_to_revisions(self, revisions: List[str]) -> Dict[str, int]:
+        """
+        Ограничивает переписывание диапазонами и выборками ревизий
+        
+        Коммиты вне выборки остаются без изменений, переписываются только
+        затронутые коммиты и их потомки.
+        
+        Args:
+            revisions: Аргументы rev-list (например: 'v3.0..main', '--branches=release/*')
+            
+        Returns:
+            Словарь с информацией о добавленных ревизиях
+        """
+        self.logger.info(f"Limiting rewrite to revisions: {revisions}")
+        return self.cleaner.limit_to_revisions(revisions)
+    
+    def set_memory_limit(self, size_str: Optional[str]) -> Dict[str, int]:
+        """
+        Ограничивает память, занимаемую кэшами очистки
+        
+        Args:
+            size_str: Бюджет в формате '512MB', '2GB' (None = без ограничения)
+            
+        Returns:
+            Словарь с установленным лимитом в байтах
+        """
+        max_bytes = parse_size(size_str) if size_str is not None else None
+        if max_bytes is not None:
+            self.logger.info(f"Limiting cache memory to {human_readable_size(max_bytes)}")
+        return self.cleaner.set_memory_limit(max_bytes)
+    
+    def plan_cleanup(self, estimate: bool = True):
+        """
+        Строит план чтения содержимого для настроенных правил
+        
+        Args:
+            estimate: Оценить объем чтения по уникальным blob'ам репозитория
+            
+        Returns:
+            План чтения (ReadPlan)
+        """
+        plan = self.cleaner.build_read_plan()
+        if estimate:
+            self.cleaner.estimate_reads(plan)
+        return plan
+    
     def run_cleanup(self) -> Dict[str, any]:
         """
         Выполняет полную очистку репозитория
@@ -149,6 +246,42 @@ class GitCleaner:
         
         return result
     
+    def iter_events(self, interval: float = 0.1, every: int = 1000) -> Iterator:
+        """
+        Выполняет очистку в фоновом потоке и возвращает поток событий
+        
+        Args:
+            interval: Минимальный интервал между событиями прогресса (секунды)
+            every: Доставлять событие прогресса не реже, чем каждые every коммитов
+            
+        Yields:
+            События из gitcleaner.events; последнее - CleanupFinished с результатом
+        """
+        events: queue.Queue = queue.Queue()
+        done = object()
+        failure = []
+        
+        def worker():
+            try:
+                result = self.run_cleanup()
+                events.put(CleanupFinished(result))
+            except BaseException as e:
+                failure.append(e)
+            finally:
+                events.put(done)
+        
+        self.cleaner.sink = CallbackSink(events.put, interval, every)
+        thread = threading.Thread(target=worker, name="gitcleaner-cleanup", daemon=True)
+        thread.start()
+        while True:
+            event = events.get()
+            if event is done:
+                break
+            yield event
+        thread.join()
+        if failure:
+            raise failure[0]
+    
     def _cleanup_git_garbage(self):
         """Очищает мусор Git после переписывания истории"""
         self.logger.info("Cleaning up Git garbage...")
@@ -158,6 +291,37 @@ class GitCleaner:
         except GitCommandError as e:
             self.logger.warning(f"Failed to cleanup Git garbage: {e}")
     
+    def verify_purged(self, purged_file: Optional[Union[str, Path]] = None,
+                      secrets: Optional[Iterable[str]] = None, workers: int = 4) -> Dict[str, any]:
+        """
+        Проверяет, что удаленные при последнем запуске blob'ы и строки недостижимы
+        
+        Args:
+            purged_file: Список удаленных blob'ов (по умолчанию - .git/gitcleaner/purged-blobs)
+            secrets: Строки, которых не должно быть ни в одном достижимом blob'е
+                (по умолчанию - строки из настроенных правил замены)
+            workers: Сколько процессов cat-file читают blob'ы одновременно
+            
+        Returns:
+            Словарь с результатами: утекшие blob'ы, найденные строки и флаг clean
+        """
+        if secrets is None:
+            secrets = [old_text for old_text, _, _ in self.cleaner.rules.text_replacements]
+        self.logger.info("Verifying that purged objects are unreachable")
+        return self.cleaner.verify_purged(purged_file, secrets, workers)
+    
+    def count_commits(self) -> int:
+        """
+        Считает коммиты репозитория
+        
+        Граф коммитов берется из постоянного инвентаря в .git/gitcleaner, поэтому
+        повторные вызовы дочитывают из git только новые коммиты.
+        
+        Returns:
+            Количество коммитов
+        """
+        return self.cleaner.count_commits()
+    
     def get_stats(self) -> Dict[str, any]:
         """
         Получает статистику репозитория
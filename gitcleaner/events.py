@@ -0,0 +1,129 @@
+"""
+События и приемники прогресса очистки
+"""
+
+import time
+from typing import Any, Callable, NamedTuple, Optional
+
+class PhaseChanged(NamedTuple):
+    """Начало новой фазы (plan, prefetch, prefilter, enumerate, rewrite, update_refs, done)
+
+    prefetch - только в частичном клоне, prefilter - только при заменах текста,
+    update_refs - только при реальном запуске.
+    """
+    phase: str
+    total: Optional[int] = None
+
+class CommitRewritten(NamedTuple):
+    """Коммит обработан (new == old, если коммит не изменился)"""
+    old: str
+    new: str
+    index: int
+    total: int
+
+class BlobDeleted(NamedTuple):
+    """Blob удален из дерева"""
+    path: str
+    blob_sha: str
+
+class RefUpdated(NamedTuple):
+    """Ссылка переведена на переписанный коммит"""
+    ref: str
+    old: str
+    new: str
+
+class CleanupFinished(NamedTuple):
+    """Очистка завершена (последнее событие в iter_events)"""
+    result: Any
+
+class EventSink:
+    """Базовый приемник событий
+
+    Если wants_events равен False, Cleaner не создает объекты событий вовсе,
+    поэтому пустой приемник ничего не стоит в горячем цикле.
+    """
+
+    wants_events = True
+
+    def emit(self, event):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class NullSink(EventSink):
+    """Приемник, игнорирующий все события"""
+
+    wants_events = False
+
+    def emit(self, event):
+        pass
+
+class CallbackSink(EventSink):
+    """Передает события в функцию, прореживая события прогресса
+
+    CommitRewritten доставляется не чаще, чем раз в interval секунд, либо
+    каждые every событий. Остальные события доставляются сразу, но перед ними
+    доставляется последнее отложенное событие прогресса.
+    """
+
+    def __init__(self, callback: Callable[[Any], None], interval: float = 0.1, every: int = 1000):
+        self.callback = callback
+        self.interval = interval
+        self.every = every
+        self._pending: Optional[CommitRewritten] = None
+        self._skipped = 0
+        self._last: Optional[float] = None
+
+    def emit(self, event):
+        if type(event) is CommitRewritten:
+            self._skipped += 1
+            if self._skipped < self.every:
+                now = time.monotonic()
+                if self._last is not None and now - self._last < self.interval:
+                    self._pending = event
+                    return
+                self._last = now
+            else:
+                self._last = time.monotonic()
+            self._skipped = 0
+            self._pending = None
+            self.callback(event)
+            return
+        self._flush()
+        self.callback(event)
+
+    def _flush(self):
+        if self._pending is not None:
+            event, self._pending = self._pending, None
+            self._skipped = 0
+            self.callback(event)
+
+    def close(self):
+        self._flush()
+
+class TqdmSink(CallbackSink):
+    """Отображает прогресс переписывания коммитов через tqdm"""
+
+    def __init__(self, interval: float = 0.1, every: int = 1000):
+        super().__init__(self._handle, interval, every)
+        self._bar = None
+
+    def _handle(self, event):
+        if type(event) is CommitRewritten:
+            if self._bar is not None:
+                self._bar.update(event.index - self._bar.n)
+        elif type(event) is PhaseChanged:
+            self._close_bar()
+            if event.phase == 'rewrite':
+                from tqdm import tqdm
+                self._bar = tqdm(total=event.total, desc="Processing commits", unit="commit")
+
+    def _close_bar(self):
+        if self._bar is not None:
+            self._bar.close()
+            self._bar = None
+
+    def close(self):
+        super().close()
+        self._close_bar()
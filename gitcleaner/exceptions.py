@@ -24,4 +24,8 @@ class GitCommandError(GitCleanerError):
         self.command = command
         self.returncode = returncode
         self.stderr = stderr
-        super().__init__(f"Git command failed: {' '.join(command)} (exit code {returncode}): {stderr}")
\ No newline at end of file
+        super().__init__(f"Git command failed: {' '.join(command)} (exit code {returncode}): {stderr}")
+
+class InvalidRuleFileError(GitCleanerError):
+    """Ошибка в файле правил"""
+    pass
\ No newline at end of file
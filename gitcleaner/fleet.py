@@ -0,0 +1,174 @@
+"""
+Очистка множества репозиториев одним набором правил
+"""
+
+import os
+import time
+import logging
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from .core import GitCleaner
+from .rules import RuleSet
+from .events import NullSink
+from .exceptions import GitCleanerError
+
+def load_manifest(manifest_path: Union[str, Path]) -> List[str]:
+    """Загружает список путей к репозиториям (по одному на строку, '#' - комментарий)"""
+    base = Path(manifest_path).resolve().parent
+    repos = []
+    with open(manifest_path, 'r', encoding='utf-8') as fh:
+        for line in fh:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                repo = Path(os.path.expanduser(line))
+                repos.append(str(repo if repo.is_absolute() else base / repo))
+    return repos
+
+class FleetCleaner:
+    """Параллельная очистка нескольких репозиториев
+
+    Правила компилируются один раз и разделяются между всеми воркерами вместе
+    с кэшами, не зависящими от репозитория (решения по путям, план чтения).
+    Репозитории планируются от самого большого к меньшему, чтобы длинные задачи
+    не оказались в конце очереди.
+    """
+
+    def __init__(self, repo_paths: List[str], rules: RuleSet, dry_run: bool = False,
+                 workers: int = 4, per_repo_limit: int = 1, memory_limit: Optional[int] = None):
+        """
+        Args:
+            repo_paths: Пути к репозиториям
+            rules: Общий набор правил
+            dry_run: Режим "пробного" запуска (без изменений)
+            workers: Общий лимит одновременно обрабатываемых репозиториев
+            per_repo_limit: Лимит одновременных задач над одним хранилищем объектов в режиме
+                dry-run, где повторы и worktree одного репозитория в манифесте проверяются
+                каждый отдельно; реальная очистка хранилища выполняется один раз
+            memory_limit: Общий бюджет памяти кэшей в байтах, делится между воркерами
+        """
+        if workers < 1 or per_repo_limit < 1:
+            raise ValueError("Concurrency limits must be positive")
+        self.repo_paths = list(repo_paths)
+        self.rules = rules
+        self.dry_run = dry_run
+        self.workers = workers
+        self.per_repo_limit = per_repo_limit
+        self.memory_limit = memory_limit
+        self.logger = logging.getLogger(__name__)
+
+        self._locks: Dict[str, threading.BoundedSemaphore] = {}
+        self._locks_guard = threading.Lock()
+
+    @staticmethod
+    def _git(repo_path: str, args: List[str]) -> Optional[str]:
+        result = subprocess.run(['git'] + args, cwd=repo_path, capture_output=True, text=True)
+        if result.returncode != 0:
+            return None
+        return result.stdout.strip()
+
+    def _repo_size(self, repo_path: str) -> int:
+        """Оценивает размер хранилища объектов в байтах (git count-objects)"""
+        if not os.path.isdir(repo_path):
+            return 0
+        output = self._git(repo_path, ['count-objects', '-v'])
+        if output is None:
+            return 0
+        size_kib = 0
+        for line in output.splitlines():
+            key, _, value = line.partition(':')
+            if key in ('size', 'size-pack'):
+                size_kib += int(value.strip() or 0)
+        return size_kib * 1024
+
+    def _store_key(self, repo_path: str) -> str:
+        """Ключ хранилища объектов: общий каталог .git (один для всех worktree)"""
+        if os.path.isdir(repo_path):
+            common_dir = self._git(repo_path, ['rev-parse', '--git-common-dir'])
+            if common_dir:
+                return str((Path(repo_path) / common_dir).resolve())
+        return str(Path(repo_path).resolve())
+
+    def _repo_lock(self, repo_path: str) -> threading.BoundedSemaphore:
+        """Возвращает семафор хранилища объектов репозитория
+
+        Две реальные очистки одного хранилища недопустимы: gc --prune=now одной
+        задачи удалит еще не привязанные к ссылкам объекты другой.
+        """
+        key = self._store_key(repo_path)
+        limit = self.per_repo_limit if self.dry_run else 1
+        with self._locks_guard:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = threading.BoundedSemaphore(limit)
+                self._locks[key] = lock
+            return lock
+
+    def _clean_repo(self, repo_path: str, size: int) -> Dict[str, any]:
+        """Очищает один репозиторий и возвращает его отчет"""
+        report = {'path': repo_path, 'size': size, 'status': 'ok', 'error': None, 'stats': None}
+        started = time.monotonic()
+        try:
+            with self._repo_lock(repo_path):
+                cleaner = GitCleaner(repo_path, self.dry_run, rules=self.rules, sink=NullSink())
+                if self.memory_limit is not None:
+                    cleaner.cleaner.set_memory_limit(self.memory_limit // self.workers)
+                result = cleaner.run_cleanup()
+                report['stats'] = result['stats']
+                report['cache_evictions'] = sum(c['evictions'] for c in result['cache_stats'].values())
+        except Exception as e:
+            # Ошибка одного репозитория не должна прерывать остальные и сводный отчет
+            report['status'] = 'failed'
+            report['error'] = str(e) if isinstance(e, (GitCleanerError, OSError)) else f"{type(e).__name__}: {e}"
+            self.logger.warning(f"Failed to clean {repo_path}: {e}")
+        report['duration'] = time.monotonic() - started
+        return report
+
+    def run(self) -> Dict[str, any]:
+        """
+        Выполняет очистку всех репозиториев
+
+        Returns:
+            Сводный отчет: отчеты по репозиториям и суммарная статистика
+        """
+        # Прогреваем общие кэши до запуска воркеров
+        self.rules.plan
+
+        # Реальная очистка хранилища выполняется один раз, даже если в манифесте его повторы
+        # или worktree; в dry-run они проверяются отдельно не более per_repo_limit одновременно
+        scheduled: List[str] = []
+        duplicates = []
+        unique: Dict[str, str] = {}
+        for path in self.repo_paths:
+            key = self._store_key(path)
+            if key in unique and not self.dry_run:
+                duplicates.append(path)
+                self.logger.info(f"Skipping {path}: same object store as {unique[key]}")
+            else:
+                unique.setdefault(key, path)
+                scheduled.append(path)
+
+        sized = sorted(((self._repo_size(path), path) for path in scheduled), reverse=True)
+        self.logger.info(f"Cleaning {len(sized)} repositories with {self.workers} workers")
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [pool.submit(self._clean_repo, path, size) for size, path in sized]
+            reports = [future.result() for future in futures]
+
+        totals: Dict[str, int] = {}
+        for report in reports:
+            for key, value in (report['stats'] or {}).items():
+                totals[key] = totals.get(key, 0) + value
+
+        return {
+            'repos': reports,
+            'totals': totals,
+            'succeeded': sum(1 for r in reports if r['status'] == 'ok'),
+            'failed': sum(1 for r in reports if r['status'] != 'ok'),
+            'duplicates': duplicates,
+            'duration': time.monotonic() - started,
+        }
@@ -0,0 +1,171 @@
+"""
+Проверка push'ей на сервере (pre-receive hook) теми же правилами, что и очистка
+"""
+
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+from .batch import CatFileBatch
+from .exceptions import GitCommandError
+from .inventory import parse_tree
+from .lfs import POINTER_MAX_SIZE
+from .rules import RuleSet
+
+def parse_ref_updates(lines: Iterable[str]) -> List[Tuple[str, str, str]]:
+    """Разбирает stdin pre-receive: строки "старый новый ссылка" -> [(старый, новый, ссылка)]"""
+    updates = []
+    for line in lines:
+        parts = line.split()
+        if len(parts) == 3:
+            updates.append((parts[0], parts[1], parts[2]))
+    return updates
+
+def _is_zero(sha: str) -> bool:
+    return not sha.strip('0')
+
+class PushChecker:
+    """Проверяет только новые объекты push'а
+
+    Перечисляются объекты, достижимые из новых вершин и недостижимые из
+    существующих ссылок (old..new для каждой обновляемой ссылки, а для новых
+    веток - без уже известной истории). Путевые правила проверяются для всех
+    записей новых деревьев, включая blob'ы, уже известные серверу. Решения по
+    путям и размерам не читают содержимое; строки ищутся одним проходом NeedleSet и только в blob'ах,
+    которые нужны правилам замены.
+    """
+
+    def __init__(self, repo_path: Union[str, Path], rules: RuleSet):
+        self.repo_path = Path(repo_path)
+        self.rules = rules
+        self._secrets = rules.needle_index()
+
+    def _new_objects(self, updates: List[Tuple[str, str, str]]) -> Iterator[Tuple[str, str]]:
+        """Потоково перечисляет новые объекты с путями: (SHA, путь; пустой у коммитов и корневых деревьев)
+
+        Пути не в UTF-8 сохраняются через surrogateescape. Любая ошибка
+        перечисления доходит до check(): push, объекты которого не удалось
+        перечислить полностью, не должен приниматься.
+        """
+        tips = [new for _, new, _ in updates if not _is_zero(new)]
+        if not tips:
+            return
+        cmd = ['git', 'rev-list', '--objects'] + tips + ['--not', '--all']
+        with tempfile.TemporaryFile() as stderr_file:
+            proc = subprocess.Popen(cmd, cwd=self.repo_path, stdout=subprocess.PIPE,
+                                    stderr=stderr_file, text=True, encoding='utf-8',
+                                    errors='surrogateescape')
+            completed = False
+            try:
+                for line in proc.stdout:
+                    sha, _, path = line.rstrip('\n').partition(' ')
+                    yield sha, path
+                completed = True
+            finally:
+                proc.stdout.close()
+                if not completed:
+                    proc.kill()
+                proc.wait()
+            if proc.returncode != 0:
+                stderr_file.seek(0)
+                raise GitCommandError(cmd, proc.returncode, stderr_file.read().decode('utf-8', 'replace'))
+
+    def _violation(self, path: str, sha: str, size: int) -> Optional[str]:
+        """Причина отказа, не требующая чтения содержимого (None - нарушений нет)"""
+        rules = self.rules
+        if sha in rules.blob_ids_to_delete:
+            return 'blob_id'
+        if rules.path_deleted(path):
+            return 'path'
+        if rules.size_threshold is not None and size > rules.size_threshold:
+            return 'size'
+        # Pointer-файл LFS не больше килобайта: файл крупнее - это содержимое в обход LFS
+        if size > POINTER_MAX_SIZE and (
+                rules.lfs_matches(path)
+                or (rules.lfs_size_threshold is not None and size > rules.lfs_size_threshold)):
+            return 'lfs'
+        return None
+
+    def check(self, updates: List[Tuple[str, str, str]]) -> List[Dict[str, str]]:
+        """Проверяет обновления ссылок и возвращает нарушения: [{'sha', 'path', 'reason'}]"""
+        violations = []
+        to_read = []
+        new_trees = []
+        checked: Set[Tuple[str, str]] = set()
+        plan = self.rules.plan
+        reader = CatFileBatch(self.repo_path)
+        try:
+            for path, sha, type_, size in reader.iter_info(self._new_objects(updates)):
+                if type_ == 'tree':
+                    new_trees.append((sha, path))
+                if type_ != 'blob':
+                    continue
+                checked.add((sha, path))
+                reason = self._violation(path, sha, size)
+                if reason is not None:
+                    violations.append({'sha': sha, 'path': path, 'reason': reason})
+                elif self._secrets and plan.needs_content(path):
+                    to_read.append((sha, path))
+
+            violations.extend(self._check_tree_paths(reader, new_trees, checked))
+
+            if to_read:
+                for (sha, _, data), (_, path) in zip(reader.iter_objects(sha for sha, _ in to_read), to_read):
+                    if data is not None and self._secrets.contains_needle(data):
+                        violations.append({'sha': sha, 'path': path, 'reason': 'secret'})
+        finally:
+            reader.close()
+        return violations
+
+    def _check_tree_paths(self, reader: CatFileBatch, new_trees: List[Tuple[str, str]],
+                          checked: Set[Tuple[str, str]]) -> List[Dict[str, str]]:
+        """Проверяет путевые правила для всех записей новых деревьев
+
+        rev-list не перечисляет blob'ы, которые уже есть на сервере, поэтому
+        копия, перенос или пустой файл под запрещенным именем видны только в
+        записях нового дерева. Здесь проверяются путь, SHA и LFS-паттерны каждой
+        записи, новый у нее blob или нет; размер и строки проверяются только у
+        новых blob'ов. Существующее поддерево не обходится, а проверяется по
+        удаляемым папкам. Новое дерево, встретившееся еще и под другим путем,
+        читается повторно для этого пути.
+        """
+        rules = self.rules
+        violations = []
+        lfs_candidates = []
+        tree_shas = {sha for sha, _ in new_trees}
+        seen = set(new_trees)
+        pending = new_trees
+        while pending:
+            next_pending = []
+            for prefix, tree, type_, data in reader.iter_tagged_objects((sha, prefix) for sha, prefix in pending):
+                if type_ != 'tree':
+                    continue
+                for mode, name, sha in parse_tree(data, len(tree) // 2):
+                    path = f'{prefix}/{name}' if prefix else name
+                    if mode == '160000':
+                        continue
+                    if mode == '040000':
+                        if sha in tree_shas:
+                            if (sha, path) not in seen:
+                                seen.add((sha, path))
+                                next_pending.append((sha, path))
+                        elif rules.folder_deleted(path):
+                            violations.append({'sha': sha, 'path': path, 'reason': 'path'})
+                        continue
+                    if (sha, path) in checked:
+                        continue
+                    checked.add((sha, path))
+                    if sha in rules.blob_ids_to_delete:
+                        violations.append({'sha': sha, 'path': path, 'reason': 'blob_id'})
+                    elif rules.path_deleted(path):
+                        violations.append({'sha': sha, 'path': path, 'reason': 'path'})
+                    elif rules.lfs_matches(path):
+                        lfs_candidates.append((sha, (sha, path)))
+            pending = next_pending
+
+        # Под LFS-паттерном допустим только pointer-файл
+        for (sha, path), _, type_, size in reader.iter_info(lfs_candidates) if lfs_candidates else ():
+            if type_ == 'blob' and size > POINTER_MAX_SIZE:
+                violations.append({'sha': sha, 'path': path, 'reason': 'lfs'})
+        return violations
@@ -0,0 +1,212 @@
+"""
+Постоянный кэш инвентаря объектов репозитория
+"""
+
+import json
+import sqlite3
+import hashlib
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS commits (sha TEXT PRIMARY KEY, tree TEXT NOT NULL, parents TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS commit_parents (sha TEXT NOT NULL, parent TEXT NOT NULL,
+                                           PRIMARY KEY (sha, parent)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS graph_order (pos INTEGER PRIMARY KEY, sha TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS trees (sha TEXT PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS tree_children (sha TEXT NOT NULL, child TEXT NOT NULL,
+                                          PRIMARY KEY (sha, child)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS blob_sizes (sha TEXT PRIMARY KEY, size INTEGER NOT NULL);
+"""
+
+# Временные таблицы пересчета графа (живут до конца update_graph)
+_TEMP_TABLES = (
+    'DROP TABLE IF EXISTS temp.new_order',
+    'DROP TABLE IF EXISTS temp.tips',
+    'DROP TABLE IF EXISTS temp.reachable',
+    'DROP TABLE IF EXISTS temp.reachable_trees',
+    'CREATE TEMP TABLE new_order (pos INTEGER PRIMARY KEY, sha TEXT NOT NULL UNIQUE)',
+    'CREATE TEMP TABLE tips (sha TEXT PRIMARY KEY)',
+    'CREATE TEMP TABLE reachable (sha TEXT PRIMARY KEY)',
+    'CREATE TEMP TABLE reachable_trees (sha TEXT PRIMARY KEY)',
+)
+
+# Версия схемы графа: при несовпадении граф коммитов загружается заново
+_GRAPH_SCHEMA = '2'
+
+# Версия схемы деревьев: деревья без записанных подкаталогов нельзя проверить на достижимость
+_TREES_SCHEMA = '1'
+
+def parse_tree(data: bytes, width: int = 20) -> List[Tuple[str, str, str]]:
+    """Разбирает сырой объект дерева: [(режим, имя, SHA)]"""
+    entries = []
+    pos = 0
+    end = len(data)
+    while pos < end:
+        space = data.index(b' ', pos)
+        nul = data.index(b'\0', space)
+        mode = data[pos:space].decode().zfill(6)
+        name = data[space + 1:nul].decode('utf-8', 'surrogateescape')
+        sha = data[nul + 1:nul + 1 + width].hex()
+        entries.append((mode, name, sha))
+        pos = nul + 1 + width
+    return entries
+
+class ObjectInventory:
+    """Граф коммитов, содержимое деревьев и размеры blob'ов в .git/gitcleaner
+
+    Деревья и размеры blob'ов неизменны для своего SHA. Порядок коммитов для
+    --all привязан к отпечатку ссылок и pack-файлов: при его изменении из git
+    дочитываются только новые коммиты, а коммиты и деревья, ставшие
+    недостижимыми (например, переписанная история с именами удаленных
+    файлов), удаляются из базы.
+    """
+
+    def __init__(self, git_dir: Union[str, Path]):
+        self.git_dir = Path(git_dir)
+        self.path = self.git_dir / 'gitcleaner' / 'inventory.sqlite'
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+        if self._get_meta('graph_schema') != _GRAPH_SCHEMA:
+            # Граф прежней версии без таблицы ребер: деревья и размеры остаются, граф читается заново
+            self._db.executescript("DELETE FROM commits; DELETE FROM commit_parents; DELETE FROM graph_order;"
+                                   "DELETE FROM meta WHERE key IN ('refs', 'packs', 'tips');")
+            self._set_meta('graph_schema', _GRAPH_SCHEMA)
+            self._db.commit()
+        if self._get_meta('trees_schema') != _TREES_SCHEMA:
+            self._db.executescript("DELETE FROM trees; DELETE FROM tree_children;")
+            self._set_meta('trees_schema', _TREES_SCHEMA)
+            self._db.commit()
+
+    def close(self):
+        """Сохраняет изменения и закрывает базу"""
+        if self._db is not None:
+            self._db.commit()
+            self._db.close()
+            self._db = None
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        row = self._db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str):
+        self._db.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    def packs_fingerprint(self) -> str:
+        """Отпечаток набора pack-файлов (имена и размеры)"""
+        pack_dir = self.git_dir / 'objects' / 'pack'
+        packs = sorted((p.name, p.stat().st_size) for p in pack_dir.glob('*.pack')) if pack_dir.is_dir() else []
+        return hashlib.sha256(json.dumps(packs).encode()).hexdigest()
+
+    @staticmethod
+    def refs_fingerprint(tips: Iterable[str]) -> str:
+        return hashlib.sha256('\n'.join(sorted(set(tips))).encode()).hexdigest()
+
+    # Граф коммитов
+
+    def graph_is_current(self, tips: List[str]) -> bool:
+        """Совпадает ли сохраненный порядок коммитов с текущими ссылками и pack-файлами"""
+        return (self._get_meta('refs') == self.refs_fingerprint(tips)
+                and self._get_meta('packs') == self.packs_fingerprint())
+
+    def known_tips(self) -> List[str]:
+        """Вершины, для которых граф уже загружен"""
+        value = self._get_meta('tips')
+        return json.loads(value) if value else []
+
+    def iter_graph(self) -> Iterator[Tuple[str, str, List[str]]]:
+        """Потоково отдает коммиты (SHA, дерево, родители) в топологическом порядке"""
+        cursor = self._db.execute(
+            'SELECT c.sha, c.tree, c.parents FROM graph_order g JOIN commits c ON c.sha = g.sha ORDER BY g.pos')
+        for sha, tree, parents in cursor:
+            yield sha, tree, parents.split() if parents else []
+
+    def count_graph(self) -> int:
+        return self._db.execute('SELECT COUNT(*) FROM graph_order').fetchone()[0]
+
+    def update_graph(self, tips: List[str], new_commits: Iterable[Tuple[str, str, List[str]]]):
+        """Дополняет граф новыми коммитами и пересчитывает порядок для текущих вершин
+
+        new_commits - коммиты, недостижимые из прежних вершин, в топологическом
+        порядке (родители раньше потомков). Достижимость считается в SQLite
+        рекурсивным запросом, не загружая граф в память; коммиты, ставшие
+        недостижимыми (удаленные или переписанные ссылки), удаляются из базы
+        вместе с деревьями, на которые больше не ссылается ни один коммит.
+        """
+        db = self._db
+        for statement in _TEMP_TABLES:
+            db.execute(statement)
+        for pos, (sha, tree, parents) in enumerate(new_commits):
+            db.execute('INSERT OR REPLACE INTO commits (sha, tree, parents) VALUES (?, ?, ?)',
+                       (sha, tree, ' '.join(parents)))
+            db.executemany('INSERT OR IGNORE INTO commit_parents (sha, parent) VALUES (?, ?)',
+                           ((sha, parent) for parent in parents))
+            db.execute('INSERT OR IGNORE INTO temp.new_order (pos, sha) VALUES (?, ?)', (pos, sha))
+
+        db.executemany('INSERT OR IGNORE INTO temp.tips (sha) VALUES (?)', ((tip,) for tip in tips))
+        db.execute("""
+            INSERT INTO temp.reachable (sha)
+            WITH RECURSIVE walk(sha) AS (
+                SELECT t.sha FROM temp.tips t JOIN commits c ON c.sha = t.sha
+                UNION
+                SELECT p.parent FROM walk w JOIN commit_parents p ON p.sha = w.sha
+            )
+            SELECT sha FROM walk
+        """)
+        db.execute('DELETE FROM commits WHERE sha NOT IN (SELECT sha FROM temp.reachable)')
+        db.execute('DELETE FROM commit_parents WHERE sha NOT IN (SELECT sha FROM temp.reachable)')
+
+        # Прежний порядок остается валидным для достижимых коммитов; новые идут после него
+        db.execute("""DELETE FROM graph_order WHERE sha NOT IN (SELECT sha FROM temp.reachable)
+                      OR sha IN (SELECT sha FROM temp.new_order)""")
+        base = db.execute('SELECT COALESCE(MAX(pos) + 1, 0) FROM graph_order').fetchone()[0]
+        db.execute('INSERT INTO graph_order (pos, sha) SELECT ? + pos, sha FROM temp.new_order', (base,))
+
+        # Деревья достижимы от корневых деревьев оставшихся коммитов по записанным подкаталогам
+        db.execute("""
+            INSERT INTO temp.reachable_trees (sha)
+            WITH RECURSIVE walk(sha) AS (
+                SELECT tree FROM commits
+                UNION
+                SELECT l.child FROM walk w JOIN tree_children l ON l.sha = w.sha
+            )
+            SELECT sha FROM walk
+        """)
+        db.execute('DELETE FROM trees WHERE sha NOT IN (SELECT sha FROM temp.reachable_trees)')
+        db.execute('DELETE FROM tree_children WHERE sha NOT IN (SELECT sha FROM temp.reachable_trees)')
+        for name in ('new_order', 'tips', 'reachable', 'reachable_trees'):
+            db.execute(f'DROP TABLE temp.{name}')
+
+        self._set_meta('refs', self.refs_fingerprint(tips))
+        self._set_meta('packs', self.packs_fingerprint())
+        self._set_meta('tips', json.dumps(sorted(set(tips))))
+        db.commit()
+
+    # Деревья и размеры blob'ов
+
+    def get_tree(self, sha: str) -> Optional[bytes]:
+        row = self._db.execute('SELECT data FROM trees WHERE sha = ?', (sha,)).fetchone()
+        return bytes(row[0]) if row else None
+
+    def put_tree(self, sha: str, data: bytes):
+        self._db.execute('INSERT OR IGNORE INTO trees (sha, data) VALUES (?, ?)', (sha, data))
+        self.put_tree_children(sha, [child for mode, _, child in parse_tree(data, len(sha) // 2)
+                                     if mode == '040000'])
+
+    def put_tree_children(self, sha: str, children: Iterable[str]):
+        """Запоминает подкаталоги дерева (и для созданных деревьев, содержимое которых не хранится)"""
+        self._db.executemany('INSERT OR IGNORE INTO tree_children (sha, child) VALUES (?, ?)',
+                             ((sha, child) for child in children))
+
+    def get_blob_size(self, sha: str) -> Optional[int]:
+        row = self._db.execute('SELECT size FROM blob_sizes WHERE sha = ?', (sha,)).fetchone()
+        return row[0] if row else None
+
+    def put_blob_sizes(self, sizes: Iterable[Tuple[str, int]]):
+        self._db.executemany('INSERT OR IGNORE INTO blob_sizes (sha, size) VALUES (?, ?)', sizes)
+
+    def forget_blobs(self, shas: Iterable[str]):
+        """Удаляет размеры blob'ов, убранных из истории"""
+        self._db.executemany('DELETE FROM blob_sizes WHERE sha = ?', ((sha,) for sha in shas))
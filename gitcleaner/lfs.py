@@ -0,0 +1,78 @@
+"""
+Перенос blob'ов в локальное хранилище Git LFS
+"""
+
+import os
+import hashlib
+import tempfile
+from pathlib import Path
+from typing import List, Tuple, Union
+
+from .batch import CatFileBatch
+from .exceptions import GitCommandError
+
+POINTER_VERSION = b'version https://git-lfs.github.com/spec/v1\n'
+
+# Максимальный размер pointer-файла по спецификации LFS
+POINTER_MAX_SIZE = 1024
+
+LFS_ATTRIBUTES = 'filter=lfs diff=lfs merge=lfs -text'
+
+def make_pointer(oid: str, size: int) -> bytes:
+    """Формирует pointer-файл LFS для объекта с данным SHA-256 и размером"""
+    return POINTER_VERSION + f'oid sha256:{oid}\nsize {size}\n'.encode()
+
+def is_pointer(data: bytes) -> bool:
+    """Проверяет, что данные уже являются pointer-файлом LFS"""
+    return len(data) <= POINTER_MAX_SIZE and data.startswith(POINTER_VERSION)
+
+def attributes_line(pattern: str) -> str:
+    """Строка .gitattributes, отдающая файлы по паттерну в LFS"""
+    return f"{pattern.replace(' ', '[[:space:]]')} {LFS_ATTRIBUTES}"
+
+def merge_attributes(data: bytes, lines: List[str]) -> bytes:
+    """Дописывает в .gitattributes недостающие строки, сохраняя существующие"""
+    text = data.decode('utf-8', 'surrogateescape')
+    existing = set(text.splitlines())
+    missing = [line for line in lines if line not in existing]
+    if not missing:
+        return data
+    if text and not text.endswith('\n'):
+        text += '\n'
+    return (text + ''.join(f'{line}\n' for line in missing)).encode('utf-8', 'surrogateescape')
+
+class LFSStore:
+    """Локальное хранилище объектов LFS (.git/lfs/objects/aa/bb/<oid>)"""
+
+    def __init__(self, git_dir: Union[str, Path]):
+        self.objects_dir = Path(git_dir) / 'lfs' / 'objects'
+        self.tmp_dir = Path(git_dir) / 'lfs' / 'tmp'
+
+    def object_path(self, oid: str) -> Path:
+        return self.objects_dir / oid[0:2] / oid[2:4] / oid
+
+    def store(self, reader: CatFileBatch, blob_sha: str) -> Tuple[str, int]:
+        """Потоково копирует blob в хранилище, считая SHA-256 на лету: (oid, размер)"""
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        digest = hashlib.sha256()
+        fd, tmp_name = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                def write(chunk: bytes):
+                    digest.update(chunk)
+                    fh.write(chunk)
+                type_, size = reader.copy(blob_sha, write)
+            if type_ != 'blob':
+                raise GitCommandError(['git', 'cat-file', '--batch'], 1, f"Object {blob_sha} is missing")
+            oid = digest.hexdigest()
+            path = self.object_path(oid)
+            if path.exists():
+                os.remove(tmp_name)  # Такое содержимое уже в хранилище
+            else:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp_name, path)
+            return oid, size
+        except BaseException:
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+            raise
@@ -0,0 +1,490 @@
+"""
+Скомпилированные правила: сопоставление путей и автомат замен
+"""
+
+import re
+import fnmatch
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+Text = Union[str, bytes]
+
+_GLOB_MAGIC = re.compile(r'[*?\[]')
+_GLOB_SPECIAL = re.compile(r'[*?\[\]]')
+
+def literal_pattern(needles: Iterable[Text]) -> Text:
+    """Строит регулярное выражение для набора строк в виде префиксного дерева
+
+    Общие префиксы выносятся за скобки, поэтому выражение проверяет каждую
+    позицию за один проход по дереву, а не перебором всех строк. В каждой
+    позиции находится самая длинная из подходящих строк. Работает и со str,
+    и с bytes (тип результата совпадает с типом строк).
+    """
+    needles = [needle for needle in needles if needle]
+    if not needles:
+        return ''
+    empty = needles[0][:0]
+    trie: Dict[Text, Any] = {}
+    for needle in needles:
+        node = trie
+        for i in range(len(needle)):
+            node = node.setdefault(needle[i:i + 1], {})
+        node[empty] = True
+
+    def build(node: Dict[Text, Any]) -> Text:
+        # Цепочки из одного потомка склеиваются без лишних групп и рекурсии
+        chain = []
+        while len(node) == 1 and empty not in node:
+            unit, node = next(iter(node.items()))
+            chain.append(re.escape(unit))
+        prefix = empty.join(chain)
+        if not node or node.keys() == {empty}:
+            return prefix
+
+        branches, singles = [], []
+        for unit in sorted(unit for unit in node if unit):
+            rest = build(node[unit])
+            if rest:
+                branches.append(re.escape(unit) + rest)
+            else:
+                singles.append(re.escape(unit))
+        if len(singles) == 1:
+            branches.append(singles[0])
+        elif singles:
+            branches.append(_wrap(empty, '[') + empty.join(singles) + _wrap(empty, ']'))
+        body = branches[0] if len(branches) == 1 else (
+            _wrap(empty, '(?:') + _wrap(empty, '|').join(branches) + _wrap(empty, ')'))
+        if empty in node:
+            # Строка может закончиться здесь: продолжение необязательно, но жадно
+            body = _wrap(empty, '(?:') + body + _wrap(empty, ')?')
+        return prefix + body
+
+    return build(trie)
+
+def _wrap(empty: Text, text: str) -> Text:
+    return text.encode() if isinstance(empty, bytes) else text
+
+class NeedleSet:
+    """Поиск набора строк без одного большого регулярного выражения
+
+    Пока строк немного, они ищутся выражением из literal_pattern: оно
+    компилируется быстро. Большой набор раскладывается по корзинам
+    q-грамм: для каждой длинной строки запоминаются граммы длины _GRAM с
+    первых step смещений, где step = (длина самой короткой строки) - _GRAM + 1.
+    Любое вхождение покрывает позицию текста, кратную step, поэтому текст
+    проверяется только в этих позициях поиском в словаре, а кандидаты
+    сверяются через startswith. Граммы и их коды однозначно следуют из строк,
+    поэтому в кэше правил сохраняются только списки кодов совпадающих грамм;
+    загрузка - одно построение словаря встроенными dict и zip. Короткие
+    строки большого набора ищутся отдельным небольшим выражением.
+
+    Семантика совпадает с выражением из literal_pattern: вхождения без
+    перекрытий, самое левое, а в одной позиции - самое длинное.
+    """
+
+    # Длина q-граммы в корзинах
+    _GRAM = 4
+    # Строки короче ищутся выражением (шаг по тексту был бы слишком мелким)
+    _MIN_INDEXED = 8
+    # До стольких строк одно выражение дешевле корзин и при компиляции, и при поиске
+    _REGEX_MAX = 64
+
+    def __init__(self, needles: Iterable[str] = ()):
+        self.indexed, self.short = self._split(needles)
+        self.short_source = literal_pattern(self.short)
+        self.step = min(map(len, self.indexed)) - self._GRAM + 1 if self.indexed else 0
+        self._packed_overflow: Optional[List[List[int]]] = None
+        self._init_lazy()
+
+    @classmethod
+    def _split(cls, needles: Iterable[str]) -> Tuple[List[str], List[str]]:
+        """Делит строки на ищущиеся корзинами и выражением: (indexed, short)"""
+        needles = sorted({needle for needle in needles if needle})
+        if len(needles) <= cls._REGEX_MAX:
+            return [], needles
+        return ([needle for needle in needles if len(needle) >= cls._MIN_INDEXED],
+                [needle for needle in needles if len(needle) < cls._MIN_INDEXED])
+
+    def _init_lazy(self):
+        self._table: Optional[Dict[str, int]] = None
+        self._overflow: List[List[int]] = []
+        self._short_regex: Optional[re.Pattern] = None
+        self._short_any: Optional[re.Pattern] = None
+
+    def __bool__(self) -> bool:
+        return bool(self.short or self.indexed)
+
+    def _get_table(self) -> Dict[str, int]:
+        """Корзины: грамма -> код (строка * step + смещение) или -1-номер списка кодов при совпадении грамм"""
+        if self._table is None:
+            gram, step = self._GRAM, self.step
+            # Код грамы - ее номер в этом списке
+            grams = [needle[offset:offset + gram] for needle in self.indexed for offset in range(step)]
+            table = dict(zip(grams, range(len(grams))))
+            overflow = self._packed_overflow
+            if overflow is None:
+                overflow = []
+                if len(table) < len(grams):
+                    shared = {key for key, count in Counter(grams).items() if count > 1}
+                    buckets: Dict[str, List[int]] = {}
+                    for code, key in enumerate(grams):
+                        if key in shared:
+                            buckets.setdefault(key, []).append(code)
+                    overflow = list(buckets.values())
+            for number, codes in enumerate(overflow):
+                table[grams[codes[0]]] = -1 - number
+            self._overflow = overflow
+            self._table = table
+        return self._table
+
+    def _iter_indexed(self, text: str) -> Iterator[Tuple[int, int]]:
+        """Все вхождения длинных строк: (начало, конец), в порядке проверенных позиций"""
+        get = self._get_table().get
+        overflow, indexed, step, gram = self._overflow, self.indexed, self.step, self._GRAM
+        for position in range(0, len(text) - gram + 1, step):
+            code = get(text[position:position + gram])
+            if code is None:
+                continue
+            for code in (overflow[-1 - code] if code < 0 else (code,)):
+                needle = indexed[code // step]
+                start = position - code % step
+                if start >= 0 and text.startswith(needle, start):
+                    yield start, start + len(needle)
+
+    def _compile_short(self) -> re.Pattern:
+        if self._short_regex is None:
+            self._short_regex = re.compile(self.short_source)
+        return self._short_regex
+
+    def search(self, text: str) -> bool:
+        """Есть ли в тексте хотя бы одна строка"""
+        if self.short and self._compile_short().search(text) is not None:
+            return True
+        return bool(self.indexed) and next(self._iter_indexed(text), None) is not None
+
+    def finditer(self, text: str) -> Iterator[Tuple[int, int]]:
+        """Вхождения без перекрытий: (начало, конец), самое левое и в одной позиции самое длинное"""
+        if not self.indexed:
+            if self.short:
+                for match in self._compile_short().finditer(text):
+                    yield match.span()
+            return
+        ends: Dict[int, int] = {}
+        for start, end in self._iter_indexed(text):
+            if end > ends.get(start, -1):
+                ends[start] = end
+        if self.short:
+            # Вхождения коротких строк во всех позициях: длинная строка может перекрыть соседнее
+            if self._short_any is None:
+                self._short_any = re.compile(f'(?=({self.short_source}))')
+            for match in self._short_any.finditer(text):
+                start, end = match.span(1)
+                if end > ends.get(start, -1):
+                    ends[start] = end
+        position = 0
+        for start in sorted(ends):
+            if start >= position:
+                position = ends[start]
+                yield start, position
+
+    def sub(self, text: str, replace: Callable[[str], str]) -> str:
+        """Заменяет вхождения строк результатом replace(строка)"""
+        parts = []
+        position = 0
+        for start, end in self.finditer(text):
+            parts.append(text[position:start])
+            parts.append(replace(text[start:end]))
+            position = end
+        if not parts:
+            return text
+        parts.append(text[position:])
+        return ''.join(parts)
+
+    def to_state(self, with_needles: bool = True) -> Dict[str, Any]:
+        """Сериализуемое состояние: списки кодов совпадающих грамм (без скомпилированных выражений)
+
+        Без with_needles сами строки не сохраняются - их передают в from_state
+        (например, строки замен уже есть в состоянии правил).
+        """
+        if self.indexed:
+            self._get_table()
+        state = {'short_source': self.short_source, 'step': self.step, 'overflow': self._overflow}
+        if with_needles:
+            state.update(short=self.short, indexed=self.indexed)
+        return state
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any], needles: Optional[Iterable[str]] = None) -> 'NeedleSet':
+        needle_set = cls.__new__(cls)
+        if needles is None:
+            needle_set.indexed, needle_set.short = state['indexed'], state['short']
+        else:
+            needle_set.indexed, needle_set.short = cls._split(needles)
+        needle_set.short_source = state['short_source']
+        needle_set.step = state['step']
+        needle_set._init_lazy()
+        needle_set._packed_overflow = state['overflow']
+        return needle_set
+
+class PathMatcher:
+    """Сопоставление путей с именами, glob-паттернами и папками
+
+    Паттерны раскладываются по видам: точные имена, суффиксы ("*.pem"),
+    префиксы ("id_rsa*") проверяются поиском в множествах. Остальные glob'ы
+    лежат в корзинах по буквальному окончанию, а внутри - по буквальному
+    началу ("config/*.yml" - по ".yml" и "config/"); glob'ы без окончания -
+    по началу. Паттерн проверяется fnmatch только тогда, когда путь попал в
+    его корзину; каждый паттерн компилируется отдельно и только при первой
+    проверке. Семантика совпадает с match_patterns: паттерн
+    проверяется и по полному пути, и по имени файла.
+    """
+
+    def __init__(self, names: Iterable[str] = (), patterns: Iterable[str] = (), folders: Iterable[str] = ()):
+        self.names = frozenset(names)
+        self.folders = frozenset(folders)
+        exact, suffixes, prefixes = set(), set(), set()
+        glob_suffixes: Dict[str, Dict[str, List[str]]] = {}
+        glob_prefixes: Dict[str, List[str]] = {}
+        globs: List[str] = []
+        for pattern in dict.fromkeys(patterns):
+            if not _GLOB_MAGIC.search(pattern):
+                exact.add(pattern)
+            elif pattern.startswith('*') and not _GLOB_MAGIC.search(pattern[1:]):
+                suffixes.add(pattern[1:])
+            elif pattern.endswith('*') and not _GLOB_MAGIC.search(pattern[:-1]):
+                prefixes.add(pattern[:-1])
+            else:
+                # Буквальный хвост после последнего спецсимвола (и ']') обязателен для совпадения
+                suffix = _GLOB_SPECIAL.split(pattern)[-1]
+                prefix = _GLOB_MAGIC.split(pattern, 1)[0]
+                if suffix:
+                    glob_suffixes.setdefault(suffix, {}).setdefault(prefix, []).append(pattern)
+                elif prefix:
+                    glob_prefixes.setdefault(prefix, []).append(pattern)
+                else:
+                    globs.append(pattern)
+        self.exact = frozenset(exact)
+        self.suffixes = frozenset(suffixes)
+        self.prefixes = frozenset(prefixes)
+        self.glob_suffixes = glob_suffixes
+        self.glob_prefixes = glob_prefixes
+        self.globs = globs
+        self._init_lengths()
+
+    def _init_lengths(self):
+        self._suffix_lengths = sorted({len(suffix) for suffix in self.suffixes})
+        self._prefix_lengths = sorted({len(prefix) for prefix in self.prefixes})
+        self._glob_suffix_lengths = sorted({len(suffix) for suffix in self.glob_suffixes})
+        # Длины начал в каждой корзине окончания
+        self._glob_bucket_lengths = {suffix: sorted({len(prefix) for prefix in bucket})
+                                     for suffix, bucket in self.glob_suffixes.items()}
+        self._glob_prefix_lengths = sorted({len(prefix) for prefix in self.glob_prefixes})
+
+    def __bool__(self) -> bool:
+        return bool(self.names or self.folders or self.exact or self.suffixes
+                    or self.prefixes or self.glob_suffixes or self.glob_prefixes or self.globs)
+
+    def _match_pattern(self, candidate: str) -> bool:
+        if candidate in self.exact:
+            return True
+        length = len(candidate)
+        for n in self._suffix_lengths:
+            if n > length:
+                break
+            if candidate[length - n:] in self.suffixes:
+                return True
+        for n in self._prefix_lengths:
+            if n > length:
+                break
+            if candidate[:n] in self.prefixes:
+                return True
+        for n in self._glob_suffix_lengths:
+            if n > length:
+                break
+            suffix = candidate[length - n:]
+            buckets = self.glob_suffixes.get(suffix)
+            if buckets is None:
+                continue
+            for m in self._glob_bucket_lengths[suffix]:
+                if m > length:
+                    break
+                bucket = buckets.get(candidate[:m])
+                if bucket and any(fnmatch.fnmatchcase(candidate, pattern) for pattern in bucket):
+                    return True
+        for n in self._glob_prefix_lengths:
+            if n > length:
+                break
+            bucket = self.glob_prefixes.get(candidate[:n])
+            if bucket and any(fnmatch.fnmatchcase(candidate, pattern) for pattern in bucket):
+                return True
+        return any(fnmatch.fnmatchcase(candidate, pattern) for pattern in self.globs)
+
+    def matches(self, path: str) -> bool:
+        """Проверяет, подходит ли путь под имя, паттерн или папку"""
+        basename = path.rsplit('/', 1)[-1]
+        if basename in self.names:
+            return True
+        if self._match_pattern(path) or (basename != path and self._match_pattern(basename)):
+            return True
+        return bool(self.folders) and not self.folders.isdisjoint(path.split('/'))
+
+    def to_state(self) -> Dict[str, Any]:
+        """Сериализуемое состояние (паттерны уже разложены по корзинам)"""
+        return {
+            'names': sorted(self.names),
+            'folders': sorted(self.folders),
+            'exact': sorted(self.exact),
+            'suffixes': sorted(self.suffixes),
+            'prefixes': sorted(self.prefixes),
+            'glob_suffixes': self.glob_suffixes,
+            'glob_prefixes': self.glob_prefixes,
+            'globs': self.globs,
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> 'PathMatcher':
+        matcher = cls.__new__(cls)
+        matcher.names = frozenset(state['names'])
+        matcher.folders = frozenset(state['folders'])
+        matcher.exact = frozenset(state['exact'])
+        matcher.suffixes = frozenset(state['suffixes'])
+        matcher.prefixes = frozenset(state['prefixes'])
+        matcher.glob_suffixes = state['glob_suffixes']
+        matcher.glob_prefixes = state['glob_prefixes']
+        matcher.globs = state['globs']
+        matcher._init_lengths()
+        return matcher
+
+class _ReplacementGroup:
+    """Замены с одинаковой областью действия: строки одним проходом NeedleSet, затем regex'ы по порядку"""
+
+    def __init__(self, scope: Optional[PathMatcher], literals: Dict[str, str], needle_set: NeedleSet,
+                 regexes: List[Tuple[str, str]]):
+        self.scope = scope
+        self.literals = literals
+        self.needle_set = needle_set
+        self.regexes = regexes
+        self._compiled_regexes: Optional[List[Tuple[re.Pattern, str]]] = None
+
+    def apply(self, text: str) -> str:
+        if self.needle_set:
+            text = self.needle_set.sub(text, self.literals.__getitem__)
+        if self.regexes:
+            if self._compiled_regexes is None:
+                self._compiled_regexes = [(re.compile(pattern), new) for pattern, new in self.regexes]
+            for regex, new in self._compiled_regexes:
+                text = regex.sub(new, text)
+        return text
+
+class Replacer:
+    """Автомат замен текста, собранный из правил
+
+    Правила группируются по области действия (паттернам файлов). Все
+    строки группы заменяются за один проход NeedleSet (самое левое, затем
+    самое длинное вхождение; результат повторно не просматривается, для
+    повторяющейся строки действует первое правило); регулярные выражения
+    применяются после них в порядке добавления и компилируются при первом
+    применении. Группы применяются в порядке первого появления.
+    """
+
+    def __init__(self, literal_rules: Iterable[Tuple[str, str, Optional[List[str]]]] = (),
+                 regex_rules: Iterable[Tuple[str, str, Optional[List[str]]]] = ()):
+        grouped = _group_rules(literal_rules, regex_rules)
+        self.groups = [
+            _ReplacementGroup(PathMatcher(patterns=scope) if scope else None,
+                              literals, NeedleSet(literals), regexes)
+            for scope, (literals, regexes) in grouped.items()]
+        self.scopes = [scope for scope in grouped]
+        self._init_needles()
+
+    def _init_needles(self):
+        self.needles = sorted({old for group in self.groups for old in group.literals})
+        self.regexes = [pattern for group in self.groups for pattern, _ in group.regexes]
+        self._needle_set: Optional[NeedleSet] = None
+
+    @property
+    def needle_set(self) -> NeedleSet:
+        """Все строки всех групп (для предварительного поиска)"""
+        if self._needle_set is None:
+            if len(self.groups) == 1:
+                self._needle_set = self.groups[0].needle_set
+            else:
+                self._needle_set = NeedleSet(self.needles)
+        return self._needle_set
+
+    def __bool__(self) -> bool:
+        return bool(self.groups)
+
+    def applicable(self, path: str) -> Tuple[int, ...]:
+        """Номера групп, область действия которых включает путь"""
+        return tuple(index for index, group in enumerate(self.groups)
+                     if group.scope is None or group.scope.matches(path))
+
+    def apply(self, text: str, path: str) -> str:
+        """Применяет к тексту замены, область действия которых включает путь"""
+        for group in self.groups:
+            if group.scope is None or group.scope.matches(path):
+                text = group.apply(text)
+        return text
+
+    @property
+    def has_unscoped(self) -> bool:
+        """Есть ли замены без паттернов файлов"""
+        return any(group.scope is None for group in self.groups)
+
+    def apply_unscoped(self, text: str) -> str:
+        """Применяет только замены без паттернов файлов (например, к сообщениям коммитов и тегов)"""
+        for group in self.groups:
+            if group.scope is None:
+                text = group.apply(text)
+        return text
+
+    def to_state(self) -> Dict[str, Any]:
+        """Сериализуемое состояние с готовыми корзинами строк
+
+        Сами правила не сохраняются: они есть в состоянии RuleSet и
+        передаются в from_state.
+        """
+        return {'groups': [
+            {'scope': list(scope) if scope else None,
+             'scope_matcher': group.scope.to_state() if group.scope else None,
+             'needle_set': group.needle_set.to_state(with_needles=False)}
+            for scope, group in zip(self.scopes, self.groups)],
+            # Для одной группы общий набор совпадает с ее набором и не дублируется
+            'needle_set': self.needle_set.to_state(with_needles=False) if len(self.groups) > 1 else None}
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any],
+                   literal_rules: Iterable[Tuple[str, str, Optional[List[str]]]] = (),
+                   regex_rules: Iterable[Tuple[str, str, Optional[List[str]]]] = ()) -> 'Replacer':
+        grouped = _group_rules(literal_rules, regex_rules)
+        scopes = [tuple(group['scope']) if group['scope'] else None for group in state['groups']]
+        if scopes != list(grouped):
+            raise ValueError("Compiled replacer does not match the rules")
+        replacer = cls.__new__(cls)
+        replacer.groups = [
+            _ReplacementGroup(PathMatcher.from_state(group['scope_matcher']) if group['scope_matcher'] else None,
+                              literals, NeedleSet.from_state(group['needle_set'], literals), regexes)
+            for group, (literals, regexes) in zip(state['groups'], grouped.values())]
+        replacer.scopes = scopes
+        replacer._init_needles()
+        if state['needle_set'] is not None:
+            replacer._needle_set = NeedleSet.from_state(state['needle_set'], replacer.needles)
+        return replacer
+
+def _group_rules(literal_rules: Iterable[Tuple[str, str, Optional[List[str]]]],
+                 regex_rules: Iterable[Tuple[str, str, Optional[List[str]]]]
+                 ) -> Dict[Optional[Tuple[str, ...]], Tuple[Dict[str, str], List[Tuple[str, str]]]]:
+    """Группирует правила по области действия: область -> (строки, регулярные выражения)"""
+    grouped: Dict[Optional[Tuple[str, ...]], Tuple[Dict[str, str], List[Tuple[str, str]]]] = {}
+    for old_text, new_text, file_patterns in literal_rules:
+        if old_text:
+            literals, _ = grouped.setdefault(_scope_key(file_patterns), ({}, []))
+            literals.setdefault(old_text, new_text)
+    for pattern, new_text, file_patterns in regex_rules:
+        _, regexes = grouped.setdefault(_scope_key(file_patterns), ({}, []))
+        regexes.append((pattern, new_text))
+    return grouped
+
+def _scope_key(file_patterns: Optional[List[str]]) -> Optional[Tuple[str, ...]]:
+    return tuple(file_patterns) if file_patterns else None
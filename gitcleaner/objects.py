@@ -0,0 +1,65 @@
+"""
+Разбор и сборка сырых объектов коммитов и аннотированных тегов
+"""
+
+from typing import Callable, List, Optional, Tuple
+
+# Заголовки подписи коммита: после переписывания подпись недействительна
+_SIGNATURE_HEADERS = (b'gpgsig', b'gpgsig-sha256')
+
+# Подпись аннотированного тега дописывается в конец сообщения
+_TAG_SIGNATURES = (b'-----BEGIN PGP SIGNATURE-----', b'-----BEGIN SSH SIGNATURE-----',
+                   b'-----BEGIN SIGNED MESSAGE-----')
+
+def split_object(raw: bytes) -> Tuple[List[bytes], bytes]:
+    """Делит объект на заголовки (с продолжениями многострочных) и сообщение"""
+    header_end = raw.find(b'\n\n')
+    if header_end == -1:
+        head, message = raw.rstrip(b'\n'), b''
+    else:
+        head, message = raw[:header_end], raw[header_end + 2:]
+    headers: List[bytes] = []
+    for line in head.split(b'\n'):
+        if line.startswith(b' ') and headers:
+            headers[-1] += b'\n' + line  # Продолжение многострочного заголовка
+        else:
+            headers.append(line)
+    return headers, message
+
+def header_value(headers: List[bytes], name: bytes) -> Optional[bytes]:
+    """Значение первого заголовка с данным именем"""
+    prefix = name + b' '
+    for header in headers:
+        if header.startswith(prefix):
+            return header[len(prefix):]
+    return None
+
+def scrub_message(message: bytes, headers: List[bytes], replace: Callable[[str], str]) -> bytes:
+    """Применяет замены к сообщению в его кодировке; сообщение, которое не декодируется, не меняется"""
+    encoding = header_value(headers, b'encoding')
+    try:
+        encoding = encoding.decode('ascii') if encoding else 'utf-8'
+        text = message.decode(encoding)
+        new_text = replace(text)
+        return message if new_text == text else new_text.encode(encoding)
+    except (UnicodeError, LookupError):
+        return message
+
+def build_commit(headers: List[bytes], tree: str, parents: List[str], message: bytes) -> bytes:
+    """Собирает коммит с новым деревом и родителями, сохраняя автора, коммиттера и кодировку"""
+    lines = [b'tree ' + tree.encode()] + [b'parent ' + parent.encode() for parent in parents]
+    for header in headers:
+        name = header.split(b' ', 1)[0]
+        if name in (b'tree', b'parent') or name in _SIGNATURE_HEADERS:
+            continue
+        lines.append(header)
+    return b'\n'.join(lines) + b'\n\n' + message
+
+def build_tag(headers: List[bytes], target: str, message: bytes) -> bytes:
+    """Собирает аннотированный тег с новым объектом; подпись тега отбрасывается"""
+    lines = [b'object ' + target.encode() if header.startswith(b'object ') else header for header in headers]
+    for marker in _TAG_SIGNATURES:
+        position = message.find(marker)
+        if position != -1 and (position == 0 or message[position - 1:position] == b'\n'):
+            message = message[:position]
+    return b'\n'.join(lines) + b'\n\n' + message
@@ -0,0 +1,89 @@
+"""
+Планирование чтения содержимого blob'ов
+"""
+
+from typing import Dict, List, Optional
+
+from .cache import LRUCache
+from .utils import match_patterns, human_readable_size
+
+# Расширения, которые заведомо бинарные: их содержимое не читается для замены текста
+# без паттернов файлов (замена, явно нацеленная на такие файлы, их читает)
+BINARY_PATTERNS = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.bmp', '*.ico', '*.webp', '*.psd',
+    '*.zip', '*.gz', '*.tgz', '*.bz2', '*.xz', '*.7z', '*.rar', '*.jar',
+    '*.pdf', '*.exe', '*.dll', '*.so', '*.dylib', '*.o', '*.a', '*.class', '*.pyc',
+    '*.mp3', '*.mp4', '*.avi', '*.mov', '*.wav', '*.ogg', '*.ttf', '*.otf', '*.woff', '*.woff2',
+]
+
+class ReadPlan:
+    """План чтения: какие blob'ы действительно нужно читать
+
+    Содержимое нужно только правилам замены текста. Удаление по имени,
+    паттерну, папке, SHA и размеру решается без чтения, поэтому при
+    отсутствии замен ни один blob не читается.
+    """
+
+    def __init__(self, replacement_scopes: List[Optional[List[str]]],
+                 binary_patterns: Optional[List[str]] = None, cache_limit: Optional[int] = None):
+        self.replacement_scopes = replacement_scopes
+        self.binary_patterns = BINARY_PATTERNS if binary_patterns is None else binary_patterns
+        self.reads_all_paths = any(scope is None for scope in replacement_scopes)
+        self._explicit_scopes = [scope for scope in replacement_scopes if scope is not None]
+        self._path_cache = LRUCache('read_plan_paths', cache_limit)
+
+        # Оценка ввода-вывода (заполняется estimate())
+        self.estimate: Optional[Dict[str, int]] = None
+
+    @property
+    def needs_any_content(self) -> bool:
+        """Нужно ли читать содержимое хотя бы одного blob'а"""
+        return bool(self.replacement_scopes)
+
+    def needs_content(self, path: str) -> bool:
+        """Проверяет, нужно ли читать содержимое blob'а по данному пути"""
+        if not self.replacement_scopes:
+            return False
+        cached = self._path_cache.get(path)
+        if cached is None:
+            # Явные паттерны замены важнее встроенного списка бинарных расширений:
+            # настоящие бинарные файлы все равно отсекает is_binary_file
+            if any(match_patterns(path, scope) for scope in self._explicit_scopes):
+                cached = True
+            elif self.binary_patterns and match_patterns(path, self.binary_patterns):
+                cached = False
+            else:
+                cached = self.reads_all_paths
+            self._path_cache[path] = cached
+        return cached
+
+    def set_estimate(self, blobs_total: int, bytes_total: int,
+                     blobs_to_read: int, bytes_to_read: int, blobs_deleted: int):
+        """Сохраняет оценку объема чтения"""
+        self.estimate = {
+            'blobs_total': blobs_total,
+            'bytes_total': bytes_total,
+            'blobs_to_read': blobs_to_read,
+            'bytes_to_read': bytes_to_read,
+            'blobs_deleted': blobs_deleted,
+        }
+
+    def describe(self) -> List[str]:
+        """Возвращает человекочитаемое описание плана"""
+        lines = []
+        if not self.needs_any_content:
+            lines.append("Содержимое blob'ов не читается: нет правил замены текста")
+        elif self.reads_all_paths:
+            lines.append("Читаются все текстовые blob'ы (есть замена без паттернов файлов)")
+        else:
+            scopes = sorted({p for scope in self.replacement_scopes for p in scope})
+            lines.append(f"Читаются только blob'ы, подходящие под: {', '.join(scopes)}")
+        if self.needs_any_content and self.binary_patterns:
+            lines.append(f"Пропускаются бинарные расширения, если их не указали в паттернах замены: "
+                         f"{len(self.binary_patterns)} паттернов")
+        if self.estimate is not None:
+            est = self.estimate
+            lines.append(f"Уникальных blob'ов: {est['blobs_total']} ({human_readable_size(est['bytes_total'])})")
+            lines.append(f"Будет удалено без чтения: {est['blobs_deleted']}")
+            lines.append(f"Будет прочитано: {est['blobs_to_read']} ({human_readable_size(est['bytes_to_read'])})")
+        return lines
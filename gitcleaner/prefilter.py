@@ -0,0 +1,143 @@
+"""
+Предварительный поиск строк для замены по уникальным blob'ам
+"""
+
+import os
+import re
+import struct
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from .batch import CatFileBatch
+from .matcher import NeedleSet
+from .utils import BlobIdSet
+
+_MAGIC = b'GCNIDX1\n'
+
+class NeedleIndex:
+    """Множество blob'ов, в которых встречается хотя бы одна искомая строка
+
+    Содержимое blob'а неизменно для его SHA, поэтому результат проверки можно
+    сохранять между запусками: повторный запуск с теми же строками проверяет
+    только blob'ы, которых еще нет в индексе. Кроме строк индекс может искать
+    регулярные выражения; выражения компилируются при первом поиске.
+    """
+
+    def __init__(self, needles: Iterable[str], regexes: Iterable[str] = (),
+                 needle_set: Optional[NeedleSet] = None):
+        self.needles = sorted({needle.encode('utf-8') for needle in needles if needle})
+        self.regexes = list(dict.fromkeys(regexes))
+        key_data = b'\0'.join(self.needles)
+        if self.regexes:
+            key_data += b'\0\0' + '\0'.join(self.regexes).encode('utf-8')
+        self.key = hashlib.sha256(key_data).hexdigest()[:16]
+        self.scanned = BlobIdSet()
+        self.hits = BlobIdSet()
+        # Строки ищутся NeedleSet (готовый, например из кэша правил, можно передать в needle_set)
+        self._needle_set = needle_set
+        self._patterns: Optional[List[re.Pattern]] = None
+
+    def __bool__(self) -> bool:
+        return bool(self.needles or self.regexes)
+
+    def _compile(self) -> Tuple[NeedleSet, List[re.Pattern]]:
+        if self._needle_set is None:
+            self._needle_set = NeedleSet(needle.decode('utf-8') for needle in self.needles)
+        if self._patterns is None:
+            self._patterns = [re.compile(regex) for regex in self.regexes]
+        return self._needle_set, self._patterns
+
+    def contains_needle(self, data: bytes) -> bool:
+        """Проверяет, есть ли в данных хотя бы одна из строк или выражений"""
+        if not self:
+            return False
+        # surrogateescape сохраняет вхождения строк UTF-8 и в файлах с некорректными байтами
+        text = data.decode('utf-8', 'surrogateescape')
+        needle_set, patterns = self._compile()
+        return needle_set.search(text) or any(pattern.search(text) is not None for pattern in patterns)
+
+    def can_skip(self, blob_sha: str) -> bool:
+        """Blob проверен и не содержит ни одной строки - его можно не читать"""
+        return blob_sha in self.scanned and blob_sha not in self.hits
+
+    def scan(self, reader: CatFileBatch, blob_shas: Iterable[str]) -> Dict[str, int]:
+        """Один раз потоково читает еще не проверенные blob'ы и запоминает совпадения"""
+        # Запросы пишутся из отдельного потока, поэтому self.scanned до конца прохода не меняется
+        pending = (sha for sha in blob_shas if sha not in self.scanned)
+        scanned, hits = BlobIdSet(), BlobIdSet()
+        bytes_scanned = 0
+        for sha, type_, data in reader.iter_objects(pending):
+            if data is None:
+                continue  # Отсутствующий объект: при переписывании будет прочитан как обычно
+            scanned.add(sha)
+            bytes_scanned += len(data)
+            if self.contains_needle(data):
+                hits.add(sha)
+        self.scanned.update(scanned)
+        self.hits.update(hits)
+        return {'blobs_scanned': len(scanned), 'blobs_hit': len(hits), 'bytes_scanned': bytes_scanned}
+
+    def find_parallel(self, repo_path: Union[str, Path], items: Iterable[Tuple[str, Any]],
+                      workers: int = 4) -> List[Any]:
+        """Ищет строки в blob'ах несколькими процессами cat-file одновременно
+
+        items - пары (SHA, метка), например генератор; каждый процесс берет
+        следующую пару по мере готовности, так что весь список в памяти не
+        нужен. Возвращаются метки blob'ов, в которых найдена хотя бы одна строка.
+        """
+        items = iter(items)
+        lock = threading.Lock()
+
+        def next_items() -> Iterator[Tuple[str, Any]]:
+            while True:
+                with lock:
+                    item = next(items, None)
+                if item is None:
+                    return
+                yield item
+
+        def search(_) -> List[Any]:
+            reader = CatFileBatch(repo_path)
+            found = []
+            for tag, _, _, data in reader.iter_tagged_objects(next_items()):
+                if data is not None and self.contains_needle(data):
+                    found.append(tag)
+            return found
+
+        if not self:
+            return []
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            return [tag for found in pool.map(search, range(max(1, workers))) for tag in found]
+
+    def save(self, path: Union[str, Path]):
+        """Сохраняет индекс (атомарно, через временный файл)"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        scanned, hits = self.scanned.to_bytes(), self.hits.to_bytes()
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'wb') as fh:
+            fh.write(_MAGIC)
+            fh.write(struct.pack('>QQ', len(scanned), len(hits)))
+            fh.write(scanned)
+            fh.write(hits)
+        os.replace(tmp_path, path)
+
+    def load(self, path: Union[str, Path]) -> bool:
+        """Загружает ранее сохраненный индекс; поврежденный файл игнорируется"""
+        try:
+            with open(path, 'rb') as fh:
+                data = fh.read()
+            if not data.startswith(_MAGIC):
+                return False
+            offset = len(_MAGIC)
+            scanned_len, hits_len = struct.unpack_from('>QQ', data, offset)
+            offset += 16
+            scanned = BlobIdSet.from_bytes(data[offset:offset + scanned_len])
+            hits = BlobIdSet.from_bytes(data[offset + scanned_len:offset + scanned_len + hits_len])
+        except (OSError, struct.error, ValueError, IndexError):
+            return False
+        self.scanned, self.hits = scanned, hits
+        return True
@@ -0,0 +1,153 @@
+"""
+Файл правил очистки и его скомпилированный кэш
+"""
+
+import os
+import json
+import hashlib
+import logging
+from pathlib import Path
+from typing import Optional, Union
+
+from .exceptions import InvalidRuleFileError
+from .rules import RuleSet
+from .utils import parse_size
+
+# Версия формата скомпилированного кэша: входит в ключ, старые кэши пересобираются
+COMPILED_VERSION = b'gitcleaner-rules-3\n'
+
+COMPILED_SUFFIX = '.compiled'
+
+# Замена по умолчанию для строк без "==>"
+DEFAULT_REPLACEMENT = '***REMOVED***'
+
+REGEX_PREFIX = 'regex:'
+
+_LIST_SECTIONS = ('files', 'patterns', 'folders', 'blob-ids', 'lfs')
+_SIZE_SECTIONS = ('size', 'lfs-size')
+
+logger = logging.getLogger(__name__)
+
+def _error(source: str, lineno: int, message: str) -> InvalidRuleFileError:
+    return InvalidRuleFileError(f"{source}:{lineno}: {message}")
+
+def parse_rules(text: str, source: str = '<rules>') -> RuleSet:
+    """Разбирает текст файла правил в RuleSet
+
+    Файл состоит из секций [files], [patterns], [folders], [blob-ids], [lfs]
+    (по одному значению на строку), [size] и [lfs-size] (один размер) и
+    [replace] со строками "старое ==> новое". Секция "[replace *.env config/*]"
+    ограничивает замены паттернами файлов; префикс "regex:" задает регулярное
+    выражение. Строки, начинающиеся с '#', - комментарии.
+    """
+    rules = RuleSet()
+    lists = {name: [] for name in _LIST_SECTIONS}
+    section: Optional[str] = None
+    scope = None
+
+    for lineno, raw_line in enumerate(text.splitlines(), 1):
+        line = raw_line.strip()
+        if not line or line.startswith('#'):
+            continue
+
+        if line.startswith('[') and line.endswith(']'):
+            header = line[1:-1].split()
+            if not header:
+                raise _error(source, lineno, "Empty section name")
+            section, args = header[0], header[1:]
+            if section == 'replace':
+                scope = args or None
+            elif section not in _LIST_SECTIONS and section not in _SIZE_SECTIONS:
+                raise _error(source, lineno, f"Unknown section [{section}]")
+            elif args:
+                raise _error(source, lineno, f"Section [{section}] takes no file patterns")
+            continue
+
+        if section is None:
+            raise _error(source, lineno, "Rule outside of a section")
+        if section == 'replace':
+            old_text, separator, new_text = line.partition('==>')
+            old_text = old_text.strip()
+            new_text = new_text.strip() if separator else DEFAULT_REPLACEMENT
+            try:
+                if old_text.startswith(REGEX_PREFIX):
+                    rules.replace_regex_in_files(old_text[len(REGEX_PREFIX):], new_text, scope)
+                elif old_text:
+                    rules.replace_text_in_files(old_text, new_text, scope)
+                else:
+                    raise ValueError("Empty text to replace")
+            except ValueError as e:
+                raise _error(source, lineno, str(e))
+        elif section in _SIZE_SECTIONS:
+            try:
+                size_bytes = parse_size(line)
+            except ValueError as e:
+                raise _error(source, lineno, str(e))
+            if section == 'size':
+                rules.delete_files_larger_than(size_bytes)
+            else:
+                rules.convert_to_lfs(size_bytes=size_bytes)
+        elif section == 'blob-ids':
+            # Допускаем формат "sha путь", как в --blob-ids
+            lists[section].append(line.split(None, 1)[0])
+        else:
+            lists[section].append(line)
+
+    try:
+        rules.delete_blobs_by_id(lists['blob-ids'])
+    except ValueError as e:
+        raise InvalidRuleFileError(f"{source}: {e}")
+    if lists['files']:
+        rules.delete_files_by_name(lists['files'])
+    if lists['patterns']:
+        rules.delete_files_by_pattern(lists['patterns'])
+    if lists['folders']:
+        rules.delete_folders(lists['folders'])
+    if lists['lfs']:
+        rules.convert_to_lfs(lists['lfs'])
+    return rules
+
+def compiled_path(path: Union[str, Path]) -> Path:
+    """Путь скомпилированного кэша рядом с файлом правил"""
+    path = Path(path)
+    return path.with_name(path.name + COMPILED_SUFFIX)
+
+def load_rules_file(path: Union[str, Path], use_cache: bool = True) -> RuleSet:
+    """Загружает файл правил, используя скомпилированный кэш рядом с ним
+
+    Кэш привязан к SHA-256 содержимого файла: пока файл не изменился,
+    разбор и компиляция (разложение паттернов по корзинам, корзины q-грамм
+    строк замены, отсортированный список SHA) не повторяются, а загрузка не
+    компилирует регулярных выражений. Кэш, который не удалось прочитать или
+    записать, просто пересобирается.
+    """
+    path = Path(path)
+    data = path.read_bytes()
+    key = hashlib.sha256(COMPILED_VERSION + data).hexdigest()
+    cache_path = compiled_path(path)
+
+    if use_cache:
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as fh:
+                cached = json.load(fh)
+            if cached.get('key') == key:
+                return RuleSet.from_state(cached['rules'])
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    try:
+        text = data.decode('utf-8')
+    except UnicodeDecodeError as e:
+        raise InvalidRuleFileError(f"{path}: not a UTF-8 file: {e}")
+    rules = parse_rules(text, str(path))
+
+    if use_cache:
+        state = {'key': key, 'rules': rules.to_state()}
+        tmp_path = cache_path.with_name(cache_path.name + '.tmp')
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as fh:
+                json.dump(state, fh, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.warning(f"Failed to save compiled rules {cache_path}: {e}")
+    return rules
@@ -0,0 +1,219 @@
+"""
+Набор правил очистки, не зависящий от конкретного репозитория
+"""
+
+import re
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from .cache import LRUCache
+from .matcher import PathMatcher, Replacer
+from .planner import ReadPlan
+from .utils import BlobIdSet
+
+class RuleSet:
+    """Правила очистки и кэши, которые можно разделять между репозиториями
+
+    Решения, зависящие только от пути (имя, паттерн, папка), и план чтения
+    кэшируются здесь, поэтому один RuleSet, используемый несколькими
+    Cleaner'ами (например, в режиме fleet), вычисляет их один раз. Правила
+    компилируются в PathMatcher и Replacer при первом использовании.
+    """
+
+    def __init__(self):
+        self.files_to_delete: Set[str] = set()
+        self.patterns_to_delete: List[str] = []
+        self.size_threshold: Optional[int] = None
+        self.text_replacements: List[Tuple[str, str, Optional[List[str]]]] = []
+        self.regex_replacements: List[Tuple[str, str, Optional[List[str]]]] = []
+        self.folders_to_delete: Set[str] = set()
+        self.blob_ids_to_delete = BlobIdSet()
+        self.lfs_patterns: List[str] = []
+        self.lfs_size_threshold: Optional[int] = None
+
+        # Кэши, сбрасываемые при изменении правил
+        self.cache_limit: Optional[int] = None
+        self._path_cache = LRUCache('rule_paths')
+        self._plan: Optional[ReadPlan] = None
+        self._matcher: Optional[PathMatcher] = None
+        self._lfs_matcher: Optional[PathMatcher] = None
+        self._replacer: Optional[Replacer] = None
+
+    def _invalidate(self):
+        """Сбрасывает кэши и скомпилированные правила после изменения правил"""
+        self._path_cache = LRUCache('rule_paths', self.cache_limit)
+        self._plan = None
+        self._matcher = None
+        self._lfs_matcher = None
+        self._replacer = None
+
+    def set_cache_limit(self, max_bytes: Optional[int]):
+        """Ограничивает память кэшей решений по путям (делится поровну с планом чтения)"""
+        self.cache_limit = max_bytes // 2 if max_bytes is not None else None
+        self._path_cache.resize(self.cache_limit)
+        if self._plan is not None:
+            self._plan._path_cache.resize(self.cache_limit)
+
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        """Статистика кэшей набора правил"""
+        stats = {'rule_paths': self._path_cache.stats()}
+        if self._plan is not None:
+            stats['read_plan_paths'] = self._plan._path_cache.stats()
+        return stats
+
+    def delete_files_by_name(self, filenames: List[str]) -> Dict[str, int]:
+        """Добавляет файлы для удаления по именам"""
+        for filename in filenames:
+            self.files_to_delete.add(filename)
+        self._invalidate()
+        return {'files_added': len(filenames)}
+
+    def delete_files_by_pattern(self, patterns: List[str]) -> Dict[str, int]:
+        """Добавляет паттерны для удаления файлов"""
+        self.patterns_to_delete.extend(patterns)
+        self._invalidate()
+        return {'patterns_added': len(patterns)}
+
+    def delete_files_larger_than(self, size_bytes: int) -> Dict[str, int]:
+        """Устанавливает порог размера для удаления файлов"""
+        self.size_threshold = size_bytes
+        return {'size_threshold': size_bytes}
+
+    def replace_text_in_files(self, old_text: str, new_text: str,
+                              file_patterns: Optional[List[str]] = None) -> Dict[str, int]:
+        """Добавляет правило замены текста"""
+        self.text_replacements.append((old_text, new_text, file_patterns))
+        self._invalidate()
+        return {'replacements_added': 1}
+
+    def replace_regex_in_files(self, pattern: str, new_text: str,
+                               file_patterns: Optional[List[str]] = None) -> Dict[str, int]:
+        """Добавляет правило замены по регулярному выражению (new_text - шаблон re.sub)"""
+        try:
+            re.compile(pattern)
+        except re.error as e:
+            raise ValueError(f"Invalid regular expression {pattern!r}: {e}")
+        self.regex_replacements.append((pattern, new_text, file_patterns))
+        self._invalidate()
+        return {'replacements_added': 1}
+
+    def delete_folders(self, folder_names: List[str]) -> Dict[str, int]:
+        """Добавляет папки для удаления"""
+        for folder in folder_names:
+            self.folders_to_delete.add(folder)
+        self._invalidate()
+        return {'folders_added': len(folder_names)}
+
+    def delete_blobs_by_id(self, blob_ids: Iterable[Union[str, bytes]]) -> Dict[str, int]:
+        """Добавляет blob'ы для удаления по их SHA (независимо от пути)"""
+        before = len(self.blob_ids_to_delete)
+        self.blob_ids_to_delete.update(blob_ids)
+        return {'blob_ids_added': len(self.blob_ids_to_delete) - before}
+
+    def convert_to_lfs(self, patterns: Optional[List[str]] = None,
+                       size_bytes: Optional[int] = None) -> Dict[str, int]:
+        """Добавляет правило переноса blob'ов в LFS (по паттернам и/или порогу размера)"""
+        if patterns:
+            self.lfs_patterns.extend(patterns)
+            self._lfs_matcher = None
+        if size_bytes is not None:
+            self.lfs_size_threshold = size_bytes
+        return {'lfs_patterns_added': len(patterns or []), 'lfs_size_threshold': size_bytes}
+
+    @property
+    def needs_sizes(self) -> bool:
+        """Нужны ли правилам размеры blob'ов"""
+        return self.size_threshold is not None or self.lfs_size_threshold is not None
+
+    def path_deleted(self, path: str) -> bool:
+        """Проверяет правила, зависящие только от пути (имя, паттерн, папка)"""
+        cached = self._path_cache.get(path)
+        if cached is None:
+            cached = self._match_path(path)
+            self._path_cache[path] = cached
+        return cached
+
+    def _match_path(self, path: str) -> bool:
+        return self.matcher.matches(path)
+
+    def folder_deleted(self, path: str) -> bool:
+        """Лежит ли каталог внутри удаляемой папки (все файлы в нем удаляются)"""
+        folders = self.matcher.folders
+        return bool(folders) and not folders.isdisjoint(path.split('/'))
+
+    def lfs_matches(self, path: str) -> bool:
+        """Подходит ли путь под паттерны переноса в LFS"""
+        if not self.lfs_patterns:
+            return False
+        if self._lfs_matcher is None:
+            self._lfs_matcher = PathMatcher(patterns=self.lfs_patterns)
+        return self._lfs_matcher.matches(path)
+
+    @property
+    def matcher(self) -> PathMatcher:
+        """Скомпилированные правила удаления по имени, паттерну и папке"""
+        if self._matcher is None:
+            self._matcher = PathMatcher(self.files_to_delete, self.patterns_to_delete, self.folders_to_delete)
+        return self._matcher
+
+    @property
+    def replacer(self) -> Replacer:
+        """Скомпилированный автомат замен текста"""
+        if self._replacer is None:
+            self._replacer = Replacer(self.text_replacements, self.regex_replacements)
+        return self._replacer
+
+    @property
+    def has_replacements(self) -> bool:
+        return bool(self.text_replacements or self.regex_replacements)
+
+    def needle_index(self) -> 'NeedleIndex':
+        """Индекс предварительного поиска по строкам и выражениям правил замены"""
+        from .prefilter import NeedleIndex
+        replacer = self.replacer
+        return NeedleIndex(replacer.needles, replacer.regexes, replacer.needle_set)
+
+    def build_read_plan(self) -> ReadPlan:
+        """Строит новый план чтения содержимого по правилам замены"""
+        return ReadPlan([file_patterns for _, _, file_patterns in self.text_replacements + self.regex_replacements],
+                        cache_limit=self.cache_limit)
+
+    @property
+    def plan(self) -> ReadPlan:
+        """Общий план чтения, используемый при переписывании"""
+        if self._plan is None:
+            self._plan = self.build_read_plan()
+        return self._plan
+
+    def to_state(self) -> Dict[str, Any]:
+        """Сериализуемое состояние правил вместе со скомпилированными матчером и автоматом"""
+        return {
+            'files': sorted(self.files_to_delete),
+            'patterns': self.patterns_to_delete,
+            'folders': sorted(self.folders_to_delete),
+            'size_threshold': self.size_threshold,
+            'text_replacements': self.text_replacements,
+            'regex_replacements': self.regex_replacements,
+            'blob_ids': self.blob_ids_to_delete.to_bytes().hex(),
+            'lfs_patterns': self.lfs_patterns,
+            'lfs_size_threshold': self.lfs_size_threshold,
+            'matcher': self.matcher.to_state(),
+            'replacer': self.replacer.to_state(),
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> 'RuleSet':
+        """Восстанавливает правила, сохраненные to_state(), без повторной компиляции"""
+        rules = cls()
+        rules.files_to_delete = set(state['files'])
+        rules.patterns_to_delete = list(state['patterns'])
+        rules.folders_to_delete = set(state['folders'])
+        rules.size_threshold = state['size_threshold']
+        rules.text_replacements = [(old, new, scope) for old, new, scope in state['text_replacements']]
+        rules.regex_replacements = [(old, new, scope) for old, new, scope in state['regex_replacements']]
+        rules.blob_ids_to_delete = BlobIdSet.from_bytes(bytes.fromhex(state['blob_ids']))
+        rules.lfs_patterns = list(state['lfs_patterns'])
+        rules.lfs_size_threshold = state['lfs_size_threshold']
+        rules._matcher = PathMatcher.from_state(state['matcher'])
+        rules._replacer = Replacer.from_state(state['replacer'], rules.text_replacements,
+                                              rules.regex_replacements)
+        return rules
@@ -4,8 +4,10 @@
 
 import os
 import re
+import bisect
+import itertools
 import fnmatch
-from typing import List, Set, Union
+from typing import Iterable, Iterator, List, Set, Union
 from pathlib import Path
 
 def human_readable_size(size_bytes: int) -> str:
@@ -73,4 +75,221 @@ def sanitize_filename(filename: str) -> str:
     invalid_chars = '<>:"/\\|?*'
     for char in invalid_chars:
         filename = filename.replace(char, '_')
-    return filename
\ No newline at end of file
+    return filename
+
+class _SortedIds:
+    """Отсортированный буфер SHA фиксированной ширины как последовательность (для bisect)"""
+
+    def __init__(self, buffer: bytes, width: int):
+        self.buffer = buffer
+        self.width = width
+
+    def __len__(self) -> int:
+        return len(self.buffer) // self.width
+
+    def __getitem__(self, index: int) -> bytes:
+        return self.buffer[index * self.width:(index + 1) * self.width]
+
+class BlobIdSet:
+    """Компактное множество идентификаторов объектов Git
+
+    Хранит SHA в бинарном виде в одном отсортированном буфере (20 байт на
+    SHA-1 вместо ~90 байт на строку в обычном set), поиск - бинарный.
+    Добавленные по одному SHA копятся в небольшом наборе и вливаются в
+    буфер пачками, размер которых растет вместе с буфером.
+    """
+
+    # Минимальный размер пачки, при котором add() вливает накопленное в буфер
+    _MIN_BATCH = 4096
+    # Размер пачки update() и окна слияния буферов (в SHA)
+    _CHUNK = 1 << 16
+    _WINDOW = 4096
+
+    def __init__(self, ids: Iterable[Union[str, bytes]] = ()):
+        self._width = 0
+        self._buffer = b''
+        self._count = 0
+        self._pending: Set[bytes] = set()
+        self.update(ids)
+
+    @staticmethod
+    def _to_raw(object_id: Union[str, bytes]) -> bytes:
+        if isinstance(object_id, bytes):
+            return object_id
+        try:
+            return bytes.fromhex(object_id)  # Пробелы по краям fromhex пропускает сам
+        except ValueError:
+            raise ValueError(f"Invalid object id: {object_id}")
+
+    def update(self, ids: Iterable[Union[str, bytes]]):
+        """Добавляет идентификаторы в множество
+
+        SHA читаются пачками по _CHUNK штук; каждая пачка сортируется и
+        склеивается в буфер, затем буферы сливаются с основным. Объекты
+        Python одновременно существуют только для одной пачки.
+        """
+        if isinstance(ids, BlobIdSet):
+            ids._flush()
+            if ids._count:
+                self._merge([ids._buffer], ids._width)
+            return
+        runs = []
+        widths = set()
+        ids = iter(ids)
+        while True:
+            chunk = list(itertools.islice(ids, self._CHUNK))
+            if not chunk:
+                break
+            try:
+                raw_ids = list(map(bytes.fromhex, chunk))
+            except (TypeError, ValueError):
+                raw_ids = [self._to_raw(object_id) for object_id in chunk]
+            runs.append(self._sorted_run(raw_ids, widths))
+        if runs:
+            if len(widths) != 1:
+                raise ValueError("Object ids must all be SHA-1 or all be SHA-256")
+            self._merge(runs, widths.pop())
+
+    @staticmethod
+    def _sorted_run(chunk: Iterable[bytes], widths: Set[int]) -> bytes:
+        """Сортирует пачку SHA без повторов и склеивает в буфер"""
+        run = sorted(set(chunk))
+        widths.update(map(len, run))
+        return b''.join(run)
+
+    def add(self, object_id: Union[str, bytes]):
+        """Добавляет один идентификатор"""
+        self._pending.add(self._to_raw(object_id))
+        if len(self._pending) >= max(self._MIN_BATCH, self._count // 8):
+            self._flush()
+
+    def _flush(self):
+        if self._pending:
+            widths = set()
+            run = self._sorted_run(self._pending, widths)
+            if len(widths) != 1:
+                raise ValueError("Object ids must all be SHA-1 or all be SHA-256")
+            self._merge([run], widths.pop())
+            self._pending = set()
+
+    def _merge(self, runs: List[bytes], width: int):
+        """Сливает отсортированные буферы с основным
+
+        Слияние идет окнами: из каждого буфера берутся SHA не больше общей
+        границы окна (не более _WINDOW на буфер), окно сортируется и
+        очищается от повторов встроенными sorted и dict.fromkeys.
+        """
+        if width not in (20, 32) or (self._count and width != self._width):
+            raise ValueError("Object ids must all be SHA-1 or all be SHA-256")
+        if self._count:
+            runs = runs + [self._buffer]
+        if len(runs) == 1:
+            merged = runs[0]
+        else:
+            views = [_SortedIds(run, width) for run in runs]
+            positions = [0] * len(views)
+            parts = []
+            while True:
+                active = [i for i, view in enumerate(views) if positions[i] < len(view)]
+                if not active:
+                    break
+                bound = min(views[i][min(positions[i] + self._WINDOW, len(views[i])) - 1] for i in active)
+                slices = []
+                for i in active:
+                    end = bisect.bisect_right(views[i], bound, positions[i])
+                    if end > positions[i]:
+                        slices.append(views[i].buffer[positions[i] * width:end * width])
+                    positions[i] = end
+                if len(slices) == 1:
+                    parts.append(slices[0])  # Окно целиком из одного буфера - уже отсортировано
+                    continue
+                window = [run[j:j + width] for run in slices for j in range(0, len(run), width)]
+                window.sort()
+                parts.append(b''.join(dict.fromkeys(window)))
+            merged = b''.join(parts)
+        self._width = width
+        self._buffer = merged
+        self._count = len(merged) // width
+
+    def _raw_ids(self) -> Iterator[bytes]:
+        width = self._width
+        buffer = self._buffer
+        for i in range(0, len(buffer), width or 1):
+            yield buffer[i:i + width]
+
+    def __contains__(self, object_id) -> bool:
+        try:
+            raw = self._to_raw(object_id)
+        except (ValueError, TypeError):
+            return False
+        if raw in self._pending:
+            return True
+        if not self._count:
+            return False
+        width = self._width
+        if len(raw) != width:
+            return False
+        buffer = self._buffer
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            current = buffer[mid * width:(mid + 1) * width]
+            if current < raw:
+                lo = mid + 1
+            elif current > raw:
+                hi = mid
+            else:
+                return True
+        return False
+
+    def __len__(self) -> int:
+        self._flush()
+        return self._count
+
+    def __sub__(self, other: 'BlobIdSet') -> 'BlobIdSet':
+        """Разность множеств за один проход по отсортированному буферу"""
+        self._flush()
+        kept = bytearray()
+        for raw in self._raw_ids():
+            if raw not in other:
+                kept += raw
+        result = BlobIdSet()
+        if kept:
+            result._width = self._width
+            result._buffer = bytes(kept)
+            result._count = len(kept) // self._width
+        return result
+
+    def to_bytes(self) -> bytes:
+        """Сериализует множество: ширина SHA (1 байт) + отсортированный буфер"""
+        self._flush()
+        return bytes([self._width]) + self._buffer
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'BlobIdSet':
+        """Восстанавливает множество, сохраненное to_bytes()"""
+        ids = cls()
+        width = data[0] if data else 0
+        if width and (width not in (20, 32) or (len(data) - 1) % width):
+            raise ValueError("Corrupted object id set")
+        ids._width = width
+        ids._buffer = bytes(data[1:])
+        ids._count = len(ids._buffer) // width if width else 0
+        return ids
+
+    def __iter__(self) -> Iterator[str]:
+        """SHA в отсортированном порядке"""
+        self._flush()
+        for raw in self._raw_ids():
+            yield raw.hex()
+
+def load_blob_ids(path: Union[str, Path]) -> BlobIdSet:
+    """Загружает список SHA blob'ов из файла (по одному на строку, '#' - комментарий)"""
+    def _iter_ids():
+        with open(path, 'r', encoding='utf-8') as fh:
+            for line in fh:
+                line = line.split('#', 1)[0].strip()
+                if line:
+                    # Допускаем формат "sha путь" (например, вывод rev-list --objects)
+                    yield line.split(None, 1)[0]
+    return BlobIdSet(_iter_ids())
@@ -3,6 +3,8 @@
 """
 
 import os
+import sys
+import time
 import tempfile
 import subprocess
 import pytest
@@ -11,6 +13,9 @@ from pathlib import Path
 
 from gitcleaner.cli import main
 
+# Бюджет времени импорта CLI сверх самого click (миллисекунды)
+CLI_IMPORT_BUDGET_MS = 50
+
 class TestCLI:
     """Тесты для CLI интерфейса"""
     
@@ -44,6 +49,27 @@ class TestCLI:
         assert result.exit_code == 0
         assert 'GitCleaner' in result.output
     
+    def test_cli_import_is_lightweight(self):
+        """Тест: импорт CLI не загружает тяжелые модули и укладывается в бюджет времени"""
+        package_root = str(Path(__file__).resolve().parent.parent)
+        env = dict(os.environ, PYTHONPATH=package_root)
+        heavy = ['colorama', 'tqdm', 'sqlite3', 'json', 'logging', 'gitcleaner.core', 'gitcleaner.fleet']
+        loaded = subprocess.run([sys.executable, '-c', 'import sys, gitcleaner.cli; '
+                                 f'print([m for m in {heavy!r} if m in sys.modules])'],
+                                env=env, capture_output=True, text=True).stdout.strip()
+        assert loaded == '[]'
+        
+        def best_of(code, runs=5):
+            best = float('inf')
+            for _ in range(runs):
+                started = time.perf_counter()
+                subprocess.run([sys.executable, '-c', code], env=env, check=True)
+                best = min(best, time.perf_counter() - started)
+            return best * 1000
+        
+        overhead = best_of('import gitcleaner.cli') - best_of('import click')
+        assert overhead < CLI_IMPORT_BUDGET_MS
+    
     def test_stats_command(self):
         """Тест команды статистики"""
         runner = CliRunner()
@@ -58,6 +84,88 @@ class TestCLI:
         assert result.exit_code == 0
         assert 'Репозиторий готов для очистки' in result.output
     
+    def test_verify_purged_command(self):
+        """Тест проверки удаленных объектов: код 1, пока строка достижима"""
+        runner = CliRunner()
+        result = runner.invoke(main, ['clean', '--path', str(self.repo_path), '--file', 'secret.key'])
+        assert result.exit_code == 0
+        result = runner.invoke(main, ['verify', '--path', str(self.repo_path), '--purged'])
+        assert result.exit_code == 0
+        assert 'Удаленные объекты недостижимы' in result.output
+        result = runner.invoke(main, ['verify', '--path', str(self.repo_path), '--purged', '--secret', 'Hello'])
+        assert result.exit_code == 1
+        assert 'test.txt' in result.output
+        
+        # Имя не в UTF-8 выводится с заменой байтов, а не падает с трассировкой
+        (self.repo_path / os.fsdecode(b'caf\xe9.txt')).write_text('Hello again')
+        subprocess.run(['git', 'add', '.'], cwd=self.repo_path, capture_output=True)
+        subprocess.run(['git', 'commit', '-m', 'Latin-1 name'], cwd=self.repo_path, capture_output=True)
+        result = runner.invoke(main, ['verify', '--path', str(self.repo_path), '--purged', '--secret', 'Hello'])
+        assert result.exit_code == 1
+        assert 'caf\ufffd.txt' in result.output
+    
+    def test_pre_receive_hook_rejects_push(self):
+        """Тест: pre-receive hook отклоняет push с запрещенным файлом"""
+        import sys
+        server = self.repo_path / 'server.git'
+        subprocess.run(['git', 'init', '--bare', str(server)], capture_output=True)
+        package_root = Path(__file__).resolve().parent.parent
+        hook = server / 'hooks' / 'pre-receive'
+        hook.write_text(f'#!/bin/sh\nPYTHONPATH="{package_root}" exec "{sys.executable}" '
+                        f'-m gitcleaner.cli hook pre-receive --file secret.key\n')
+        hook.chmod(0o755)
+        
+        result = subprocess.run(['git', 'push', str(server), 'HEAD:refs/heads/main'],
+                                cwd=self.repo_path, capture_output=True, text=True)
+        assert result.returncode != 0
+        assert 'secret.key' in result.stderr and 'push отклонен' in result.stderr
+    
+    def test_pre_receive_hook_checks_paths_of_existing_blobs(self):
+        """Тест: копия уже известного серверу blob'а под запрещенным именем или в запрещенной папке отклоняется"""
+        import sys
+        server = self.repo_path / 'server.git'
+        subprocess.run(['git', 'init', '--bare', str(server)], capture_output=True)
+        package_root = Path(__file__).resolve().parent.parent
+        hook = server / 'hooks' / 'pre-receive'
+        hook.write_text(f'#!/bin/sh\nPYTHONPATH="{package_root}" exec "{sys.executable}" '
+                        f'-m gitcleaner.cli hook pre-receive --file id_rsa --folder secrets\n')
+        hook.chmod(0o755)
+        git = lambda *args: subprocess.run(['git'] + list(args), cwd=self.repo_path, capture_output=True, text=True)
+        (self.repo_path / 'docs').mkdir()
+        (self.repo_path / 'docs' / 'readme.txt').write_text('Hello World')
+        git('add', '.')
+        git('commit', '-m', 'Docs')
+        assert git('push', str(server), 'HEAD:refs/heads/main').returncode == 0
+        
+        cases = [
+            'id_rsa',              # Существующее содержимое под запрещенным именем
+            'secrets/other.txt',   # ... в новом каталоге запрещенной папки
+            'secrets/readme.txt',  # Каталог совпадает с принятым docs: ни нового blob'а, ни нового дерева
+        ]
+        for path in cases:
+            (self.repo_path / path).parent.mkdir(parents=True, exist_ok=True)
+            (self.repo_path / path).write_text('Hello World')
+            git('add', '.')
+            git('commit', '-m', 'Copy')
+            result = git('push', str(server), 'HEAD:refs/heads/main')
+            assert result.returncode != 0, path
+            assert path.split('/')[0] in result.stderr and 'push отклонен' in result.stderr
+            git('reset', '-q', '--hard', 'HEAD~1')
+    
+    def test_pre_receive_hook_fails_closed(self, monkeypatch):
+        """Тест: pre-receive hook отклоняет push при любой ошибке перечисления объектов"""
+        from gitcleaner.hook import PushChecker
+        def broken_listing(self, updates):
+            raise RuntimeError("listing failed")
+            yield
+        monkeypatch.setattr(PushChecker, '_new_objects', broken_listing)
+        head = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=self.repo_path,
+                              capture_output=True, text=True).stdout.strip()
+        result = CliRunner().invoke(main, ['hook', 'pre-receive', '--path', str(self.repo_path), '--file', 'id_rsa'],
+                                    input=f'{"0" * 40} {head} refs/heads/main\n')
+        assert result.exit_code == 1
+        assert 'ошибка проверки: listing failed' in result.output
+    
     def test_clean_command_dry_run(self):
         """Тест команды очистки в режиме dry-run"""
         runner = CliRunner()
@@ -70,6 +178,43 @@ class TestCLI:
         ])
         assert result.exit_code == 0
         assert 'Это был пробный запуск' in result.output
+    
+    def test_clean_command_replace_with_empty_text(self):
+        """Тест: --replace-new '' заменяет строку пустой, как в fleet и hook"""
+        runner = CliRunner()
+        result = runner.invoke(main, ['clean', '--path', str(self.repo_path),
+                                      '--replace-old', 'SECRET_KEY=', '--replace-new', ''])
+        assert result.exit_code == 0
+        assert 'Правил замены текста: 1' in result.output
+        content = subprocess.run(['git', 'show', 'HEAD:secret.key'], cwd=self.repo_path,
+                                 capture_output=True, text=True).stdout
+        assert content == '12345'
+    
+    def test_clean_command_rules_file(self):
+        """Тест очистки по файлу правил"""
+        rules_path = self.repo_path / 'policy.rules'
+        rules_path.write_text('[files]\nsecret.key\n[replace *.txt]\nHello ==> Hi\n')
+        runner = CliRunner()
+        result = runner.invoke(main, ['clean', '--path', str(self.repo_path), '--rules', str(rules_path)])
+        assert result.exit_code == 0
+        assert 'Удалено файлов: 1' in result.output and 'Заменено файлов: 1' in result.output
+        assert (self.repo_path / 'policy.rules.compiled').exists()
+    
+    def test_fleet_command_dry_run(self):
+        """Тест очистки нескольких репозиториев в режиме dry-run"""
+        manifest = self.repo_path / 'repos.txt'
+        manifest.write_text(f'# fleet\n{self.repo_path}\n{self.repo_path / "missing"}\n')
+        runner = CliRunner()
+        result = runner.invoke(main, [
+            'fleet',
+            '--manifest', str(manifest),
+            '--dry-run',
+            '--file', 'secret.key',
+            '--report', str(self.repo_path / 'report.json')
+        ])
+        assert result.exit_code == 1
+        assert 'Успешно: 1, с ошибками: 1' in result.output
+        assert (self.repo_path / 'report.json').exists()
 
 if __name__ == '__main__':
     pytest.main([__file__])
\ No newline at end of file